@@ -8,91 +8,87 @@ Caleb对话分析自动化脚本
 版本：1.0
 """
 
+import argparse
 import os
-import re
 import sys
-from character_dialogue_analyzer import CharacterDialogueAnalyzer
+from dialogue_extractor import extract_dialogues
+from pipeline_metrics import PipelineMetrics, ProgressReporter, measure, profiled
 
-def extract_caleb_dialogues(input_folder, output_file):
+def extract_caleb_dialogues(input_folder, output_file, workers=1, manifest_path=None, metrics=None):
     """
     从对话文件中提取Caleb的对话
     
     参数:
-    input_folder: 包含对话文件的文件夹路径
+    input_folder: 包含对话文件的文件夹路径（会递归遍历子文件夹）
     output_file: 输出文件路径，用于保存Caleb的对话
+    workers: 并行提取的进程数，1为串行，0表示使用全部CPU核心
+    manifest_path: 增量提取清单路径，提供时只重新解析新增或变化的文件
+    metrics: PipelineMetrics 实例，提供时记录提取阶段的耗时、条数和字节数
     
     返回:
     int: 提取的对话数量
     """
-    caleb_dialogues = []
-    
-    # 遍历文件夹中的所有txt文件
-    for filename in os.listdir(input_folder):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(input_folder, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                            
-                        # 匹配Caleb的对话行，考虑不同的冒号格式和大小写
-                        caleb_patterns = [
-                            r'^Caleb[：:]\s*(.+)',
-                            r'^caleb[：:]\s*(.+)',
-                            r'^CALEB[：:]\s*(.+)'
-                        ]
-                        
-                        match = None
-                        for pattern in caleb_patterns:
-                            match = re.match(pattern, line)
-                            if match:
-                                break
-                        
-                        if match:
-                            dialogue = match.group(1).strip()
-                            # 排除非对话内容（如"思考.jpg"等）
-                            if dialogue and not any(x in dialogue.lower() for x in ['jpg', 'png', '图片']):
-                                caleb_dialogues.append(dialogue)
-                                print(f"从{filename}中提取: {dialogue}")
-                                
-            except Exception as e:
-                print(f"读取文件{filename}时出错: {str(e)}")
-    
-    # 保存提取的对话
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for dialogue in caleb_dialogues:
-            f.write(dialogue + '\n')
-    
-    print(f"已提取 {len(caleb_dialogues)} 条Caleb的对话")
+    with measure(metrics, 'extract') as record, ProgressReporter("已提取对话") as progress:
+        counts = extract_dialogues(input_folder, {'Caleb': output_file}, workers, manifest_path, progress)
+        dialogue_count = counts['Caleb']
+        record.add(items=dialogue_count, n_bytes=os.path.getsize(output_file))
+    
+    print(f"已提取 {dialogue_count} 条Caleb的对话")
     print(f"保存到文件: {output_file}")
-    return len(caleb_dialogues)
+    return dialogue_count
 
-def analyze_caleb_dialogues(dialogues_file):
+def analyze_caleb_dialogues(dialogues_file, metrics=None, dedupe=False, dedupe_threshold=None):
     """
     使用CharacterDialogueAnalyzer分析Caleb的对话
     
     参数:
     dialogues_file: 包含Caleb对话的文件路径
+    metrics: PipelineMetrics 实例，提供时分别记录加载、分词、情感分析、关键词和词云各阶段
+    dedupe: 为True时先合并重复和近似重复的对话，分析结果按出现次数加权
+    dedupe_threshold: 近似重复阈值，为None时使用 dedup.DEFAULT_THRESHOLD
+    
+    返回:
+    bool: 分析是否成功完成
     """
     try:
+        # 分析器依赖jieba、wordcloud等较重的库，只在进入分析阶段时才导入
+        from character_dialogue_analyzer import CharacterDialogueAnalyzer
+        
         # 创建分析器实例
         analyzer = CharacterDialogueAnalyzer()
         
         # 加载对话文件
         print("\n开始加载Caleb的对话...")
-        success = analyzer.load_dialogues_from_file(dialogues_file)
+        with measure(metrics, 'load') as record:
+            success = analyzer.load_dialogues_from_file(dialogues_file)
+            record.add(items=len(analyzer.dialogues), n_bytes=os.path.getsize(dialogues_file))
         
         if not success:
             print("加载对话失败，请检查文件格式")
             return False
+        if not analyzer.dialogues:
+            print("没有可分析的对话")
+            return False
+        
+        if dedupe:
+            with measure(metrics, 'dedupe') as record:
+                record.add(items=len(analyzer.dialogues))
+                analyzer.deduplicate(dedupe_threshold)
         
-        # 执行完整分析
+        # 执行完整分析（与 run_complete_analysis 相同的步骤，逐个阶段计量）
         print("\n开始进行对话分析...")
-        analyzer.run_complete_analysis(dialogues_file)
+        with measure(metrics, 'tokenize') as record:
+            record.add(items=analyzer.build_matrix().n_docs)
+        with measure(metrics, 'sentiment') as record:
+            analyzer.analyze_sentiment()
+            record.add(items=analyzer.matrix.n_docs)
+        with measure(metrics, 'keywords') as record:
+            analyzer.extract_keywords()
+            record.add(items=len(analyzer.matrix.vocabulary))
+        with measure(metrics, 'word_clouds') as record:
+            paths = analyzer.generate_word_clouds(metrics)
+            record.add(items=len(paths), n_bytes=sum(os.path.getsize(path) for path in paths.values()))
+        analyzer.save_results()
         
         print("\n分析完成！")
         print(f"分析结果保存在: {analyzer.output_dir} 文件夹中")
@@ -102,16 +98,55 @@ def analyze_caleb_dialogues(dialogues_file):
         print(f"分析过程中出错: {str(e)}")
         return False
 
-def main():
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Caleb对话分析自动化脚本")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="并行提取对话的进程数，0表示使用全部CPU核心（默认1）")
+    parser.add_argument('--full', action='store_true',
+                        help="忽略增量提取清单，重新解析全部文件")
+    parser.add_argument('--store', metavar='PATH',
+                        help="同时把所有角色的对话及场景、轮次、词ID写入列式存储（如 dialogues.arrow）")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="分析前合并重复和近似重复的对话，分词和情感匹配每条唯一对话只做一次")
+    parser.add_argument('--dedupe-threshold', type=float, metavar='THRESHOLD',
+                        help="近似重复阈值，字符片段的Jaccard相似度（默认0.8）")
+    parser.add_argument('--trajectory', metavar='PATH',
+                        help="同时流式计算各场景、各对话对象的情感轨迹并写入该文件（.csv 或 .parquet），另存同名 .png 图表")
+    parser.add_argument('--report', default=os.path.join('analysis_results', 'report.html'), metavar='HTML',
+                        help="分析报告的输出路径（默认analysis_results/report.html），分析失败时不生成")
+    parser.add_argument('--metrics', nargs='?', const='', metavar='JSON',
+                        help="输出各阶段的耗时、CPU时间、条数、字节数和内存高水位，提供路径时同时保存为JSON")
+    parser.add_argument('--profile', metavar='PSTATS', help="用cProfile记录整个流程并保存到该文件")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """
     主函数
     """
+    args = parse_args(argv)
+    metrics = PipelineMetrics() if args.metrics is not None else None
+    with profiled(args.profile):
+        status = run_pipeline(args, metrics)
+    
+    if metrics is not None:
+        metrics.print_summary()
+        if args.metrics:
+            metrics.save_json(args.metrics)
+            print(f"各阶段指标已保存到: {args.metrics}")
+    return status
+
+def run_pipeline(args, metrics=None):
+    """
+    执行提取和分析的完整流程
+    """
     print("Caleb对话分析自动化脚本 v1.0")
     print("================================\n")
     
     # 设置文件夹和文件路径
     caleb_data_folder = "Caleb_data"
     caleb_dialogues_file = "caleb_dialogues.txt"
+    manifest_file = "caleb_dialogues.manifest.json"
     
     # 确保路径存在
     if not os.path.exists(caleb_data_folder):
@@ -120,20 +155,49 @@ def main():
     
     # 提取Caleb的对话
     print(f"从{caleb_data_folder}文件夹中提取Caleb的对话...\n")
-    dialogue_count = extract_caleb_dialogues(caleb_data_folder, caleb_dialogues_file)
+    if args.full and os.path.exists(manifest_file):
+        os.remove(manifest_file)
+    dialogue_count = extract_caleb_dialogues(caleb_data_folder, caleb_dialogues_file, args.workers,
+                                             manifest_file, metrics)
     
     if dialogue_count == 0:
         print("没有提取到任何Caleb的对话，请检查文件格式")
         return 1
     
+    if args.store:
+        from dialogue_store import build_store
+        with measure(metrics, 'store') as record:
+            n_rows = build_store(caleb_data_folder, args.store, workers=args.workers)
+            record.add(items=n_rows, n_bytes=os.path.getsize(args.store))
+        print(f"已写入 {n_rows} 条对话到列式存储: {args.store}")
+    
+    if args.trajectory:
+        from sentiment_trajectory import build_trajectory, plot_trajectory
+        with measure(metrics, 'trajectory') as record:
+            aggregator = build_trajectory(caleb_data_folder, args.trajectory, workers=args.workers)
+            plot_trajectory(aggregator, os.path.splitext(args.trajectory)[0] + '.png')
+            record.add(items=aggregator.overall.running.n)
+        print(f"情感轨迹已保存到: {args.trajectory}")
+    
     # 分析Caleb的对话
     print("\n开始分析Caleb的对话情感和生成词云...")
-    analyze_caleb_dialogues(caleb_dialogues_file)
+    with measure(metrics, 'analyze'):
+        analyzed = analyze_caleb_dialogues(caleb_dialogues_file, metrics, args.dedupe, args.dedupe_threshold)
+    
+    # 由分析结果重新生成HTML报告（只重新渲染有变化的部分）；分析失败时保留上一次的报告
+    if analyzed:
+        from report_generator import build_report
+        with measure(metrics, 'report') as record:
+            cache = build_report(report_path=args.report, workers=args.workers)
+            record.add(items=cache.hits + cache.misses, n_bytes=os.path.getsize(args.report))
+        print(f"分析报告已保存到: {args.report}（复用 {cache.hits} 个片段，重新生成 {cache.misses} 个）")
+    else:
+        print("分析未完成，跳过生成分析报告")
     
     print("\n完整工作流程执行完毕！")
     print("你现在可以查看以下内容：")
     print("1. 提取的Caleb对话: caleb_dialogues.txt")
-    print("2. 分析结果和词云: analysis_results文件夹")
+    print("2. 分析结果和词云: analysis_results文件夹，分析报告: " + args.report)
     print("   - 总体词云: wordcloud.png")
     print("   - 积极词汇词云: positive_wordcloud.png")
     print("   - 消极词汇词云: negative_wordcloud.png")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+词云素材缓存
+功能：在进程内缓存解码后的形状模板（mask）数组和字体对象，键为路径和修改时间，
+      按最近使用淘汰并限制总大小。mask第一次解码后保存为.npy文件，之后以只读mmap方式加载，
+      多个工作进程共享操作系统页缓存中的同一份数据，不再重复解码图片；
+      磁盘上的.npy文件同样限制总大小，按最近使用（文件修改时间）淘汰
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'masks')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 磁盘上mask .npy文件的总大小上限
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+# 每个字体对象按此大小计入缓存（FreeType按需读取字体文件，不会整体载入内存）
+FONT_ENTRY_BYTES = 64 * 1024
+
+# 找不到字体文件时依次查找的系统字体目录
+FONT_DIRS = (
+    os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'),
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'),
+    '/Library/Fonts',
+    '/System/Library/Fonts',
+)
+
+
+class AssetCache:
+    """
+    按最近使用淘汰、限制总大小的素材缓存（线程安全）
+
+    参数:
+    max_bytes: 缓存内容总大小上限
+    cache_dir: mask的.npy文件存放目录
+    max_disk_bytes: cache_dir 中.npy文件的总大小上限
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return None
+
+    def _put(self, key, value, size):
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._size -= evicted_size
+        return value
+
+    def load_mask(self, path):
+        """
+        加载形状模板，返回只读的NumPy数组
+
+        参数:
+        path: 图片路径
+
+        返回:
+        numpy.ndarray: 与 np.array(Image.open(path)) 相同的数组，但不可写
+        """
+        stat = os.stat(path)
+        key = ('mask', os.path.abspath(path), stat.st_mtime_ns)
+        mask = self._get(key)
+        if mask is None:
+            mask = self._decode_mask(path, stat)
+            self._put(key, mask, mask.nbytes)
+        return mask
+
+    def _decode_mask(self, path, stat):
+        import numpy as np
+
+        digest = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+        npy_path = os.path.join(self.cache_dir, digest.hexdigest() + '.npy')
+        try:
+            mask = np.load(npy_path, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+        else:
+            # 修改时间记录最近一次使用，淘汰时先删最久没用的文件
+            try:
+                os.utime(npy_path)
+            except OSError:
+                pass
+            return mask
+
+        from PIL import Image
+
+        with Image.open(path) as image:
+            mask = np.array(image)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = npy_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, mask)
+        os.replace(tmp_path, npy_path)
+        mask = np.load(npy_path, mmap_mode='r')
+        self.prune_disk(keep=npy_path)
+        return mask
+
+    def prune_disk(self, keep=None):
+        """
+        按最近使用删除.npy文件，直到总大小不超过 max_disk_bytes
+
+        已映射的文件被删除后，现有的映射仍然有效（删除失败时跳过，如Windows上正在使用的文件）
+
+        参数:
+        keep: 不删除的文件（刚写入的文件）
+
+        返回:
+        int: 删除的文件数
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def load_font(self, font_path, size):
+        """
+        加载指定字号的字体对象
+
+        参数:
+        font_path: 字体文件路径（会经过 resolve_font_path 查找）
+        size: 字号
+
+        返回:
+        PIL.ImageFont.FreeTypeFont
+        """
+        path = resolve_font_path(font_path)
+        key = ('font', path, os.stat(path).st_mtime_ns, size)
+        font = self._get(key)
+        if font is None:
+            from PIL import ImageFont
+
+            font = self._put(key, ImageFont.truetype(path, size), FONT_ENTRY_BYTES)
+        return font
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+_font_paths = {}
+
+
+def resolve_font_path(font_path):
+    """
+    查找字体文件：先按给定路径查找，找不到时在系统字体目录中按文件名查找，结果在进程内缓存
+
+    返回:
+    str: 字体文件的绝对路径；找不到时原样返回，由调用方报错
+    """
+    if font_path in _font_paths:
+        return _font_paths[font_path]
+
+    resolved = font_path
+    if os.path.exists(font_path):
+        resolved = os.path.abspath(font_path)
+    else:
+        name = os.path.basename(font_path).lower()
+        for font_dir in FONT_DIRS:
+            for root, _, files in os.walk(font_dir):
+                match = next((f for f in files if f.lower() == name), None)
+                if match:
+                    resolved = os.path.join(root, match)
+                    break
+            if resolved != font_path:
+                break
+
+    _font_paths[font_path] = resolved
+    return resolved
+
+
+# 进程内共享的默认缓存
+default_cache = AssetCache()
+
+
+def load_mask(path):
+    """从默认缓存加载形状模板"""
+    return default_cache.load_mask(path)
+
+
+def load_font(font_path, size):
+    """从默认缓存加载字体对象"""
+    return default_cache.load_font(font_path, size)
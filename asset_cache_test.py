@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+素材缓存内存测试脚本
+反复渲染约一万次词云（轮换多个形状模板和字号），检查进程内存和各级缓存的大小不随渲染次数增长
+
+用法:
+python asset_cache_test.py              # 使用 simhei.ttf（找不到时在系统字体目录中查找）
+python asset_cache_test.py 某字体.ttf 10000
+"""
+
+import io
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+import asset_cache
+import fast_layout
+from word_cloud_generator import render_word_cloud
+
+# 限制缓存上限，使测试期间多次触发淘汰
+MAX_BYTES = 4 * 1024 * 1024
+MAX_DISK_BYTES = 512 * 1024
+N_MASKS = 24
+# 预热后进程内存（最大常驻集）允许的增长
+MAX_RSS_GROWTH_MB = 64
+
+
+def disk_bytes(cache):
+    return sum(os.path.getsize(os.path.join(cache.cache_dir, name)) for name in os.listdir(cache.cache_dir))
+
+
+def max_rss_mb():
+    """进程的最大常驻集（MB），Linux以KB为单位、macOS以字节为单位"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def make_masks(work_dir):
+    """生成形状模板：白色背景上的黑色椭圆，尺寸各不相同"""
+    mask_paths = []
+    for i in range(N_MASKS):
+        width, height = 160 + 8 * i, 120 + 4 * i
+        y, x = np.ogrid[:height, :width]
+        inside = ((x - width / 2) / (width / 2)) ** 2 + ((y - height / 2) / (height / 2)) ** 2 <= 1
+        path = os.path.join(work_dir, f'mask_{i}.png')
+        Image.fromarray(np.where(inside, 0, 255).astype(np.uint8)).save(path)
+        mask_paths.append(path)
+    return mask_paths
+
+
+def main():
+    print("=== 素材缓存内存测试 ===")
+
+    font_path = sys.argv[1] if len(sys.argv) > 1 else 'simhei.ttf'
+    n_renders = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    if not os.path.exists(asset_cache.resolve_font_path(font_path)):
+        sys.exit(f"✗ 找不到字体文件 {font_path}，请在命令行中指定一个字体")
+
+    work_dir = tempfile.mkdtemp(prefix='asset_cache_test_')
+    asset_cache.default_cache = cache = asset_cache.AssetCache(MAX_BYTES, os.path.join(work_dir, 'masks'),
+                                                               MAX_DISK_BYTES)
+    mask_paths = make_masks(work_dir)
+
+    words = [f'word{i}' for i in range(60)]
+    generator = np.random.default_rng(0)
+    warmup = min(1000, n_renders // 10)
+    rss_after_warmup = None
+
+    print(f"\n渲染 {n_renders} 次（{N_MASKS} 个形状模板，缓存上限 {MAX_BYTES // 1024 // 1024} MB）...")
+    try:
+        for i in range(n_renders):
+            frequencies = dict(zip(words, generator.integers(1, 100, len(words)).tolist()))
+            buffer = io.BytesIO()
+            render_word_cloud(frequencies, buffer, mask_paths[i % N_MASKS], layout='fast', font_path=font_path,
+                              max_words=30, max_font_size=int(generator.integers(20, 80)))
+            assert buffer.tell() > 0, "没有写出图片"
+            if i + 1 == warmup:
+                rss_after_warmup = max_rss_mb()
+            if (i + 1) % 1000 == 0:
+                print(f"  {i + 1} 次: 内存 {max_rss_mb():.1f} MB，缓存 {cache._size / 1024 / 1024:.1f} MB"
+                      f"（{len(cache._items)} 项），mask文件 {len(os.listdir(cache.cache_dir))} 个"
+                      f"（{disk_bytes(cache) / 1024:.0f} KB），"
+                      f"字形 {fast_layout.glyph.cache_info().currsize} 个")
+
+        growth = max_rss_mb() - rss_after_warmup
+        glyphs = fast_layout.glyph.cache_info()
+        # WordCloud的默认配色会导入pyplot，但无界面渲染不应创建任何图形
+        pyplot = sys.modules.get('matplotlib.pyplot')
+        assert pyplot is None or not pyplot.get_fignums(), "渲染过程中留下了未关闭的matplotlib图形"
+        assert cache._size <= MAX_BYTES, f"缓存大小 {cache._size} 超过上限 {MAX_BYTES}"
+        assert cache.hits > 0, "缓存没有命中"
+        assert disk_bytes(cache) <= MAX_DISK_BYTES, f"mask文件共 {disk_bytes(cache)} 字节，超过上限 {MAX_DISK_BYTES}"
+        assert glyphs.currsize <= glyphs.maxsize, "字形缓存超过上限"
+        # 给定的字体名和解析后的绝对路径各一项
+        assert len(asset_cache._font_paths) <= 2, "字体路径缓存随渲染次数增长"
+        assert growth <= MAX_RSS_GROWTH_MB, f"预热后内存增长 {growth:.1f} MB，超过 {MAX_RSS_GROWTH_MB} MB"
+        print(f"✓ 预热后内存增长 {growth:.1f} MB，缓存命中 {cache.hits} 次、未命中 {cache.misses} 次")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
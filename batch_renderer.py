@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量词云渲染
+功能：整个语料只分词、计数一次，按（场景, 角色）分组保存词频和情感词命中，
+      总体、积极、消极、每个场景和每个角色的词云都由这份分组计数筛选合并得到，
+      再把各个词云分配到多个进程并行布局和编码。N张词云的代价约为一次分词加N次布局
+
+用法:
+python batch_renderer.py Caleb_data -o analysis_results -j 0
+python batch_renderer.py --store dialogues.arrow --speakers Caleb --preset thumbnail --layout fast
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+from array import array
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+
+from character_dialogue_analyzer import (DEFAULT_NEGATIVE_WORDS, DEFAULT_POSITIVE_WORDS, DEFAULT_STOPWORDS,
+                                         SENTIMENT_LABELS, load_word_list, sentiment_hits, sentiment_matcher)
+from dialogue_extractor import DEFAULT_SPEAKERS, iter_folder_turns, resolve_workers, speaker_key
+from token_cache import iter_line_tokens
+from token_corpus import Vocabulary
+from word_cloud_generator import LAYOUT_ENGINES, RENDER_PRESETS, clean_text, frequencies_from_array
+
+
+class CorpusCounts:
+    """
+    按（场景, 角色）分组的词频和情感词命中
+
+    对话以词ID保存（见 token_corpus），各分组的词频在ID数组上向量化统计，
+    停用词和纯数字也按词ID的掩码一次性去掉。角色名不区分大小写，同一角色归入一个分组，
+    使用第一次出现时的写法
+
+    参数:
+    matcher: 情感词典匹配器（sentiment_matcher 的返回值）
+    stopwords: 不进入词云的词
+    vocabulary: 共用的词表（token_corpus.Vocabulary），为None时新建
+    """
+
+    def __init__(self, matcher, stopwords=DEFAULT_STOPWORDS, vocabulary=None):
+        self.matcher = matcher
+        self.stopwords = set(stopwords)
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.groups = []
+        self.sentiment = defaultdict(lambda: {label: Counter() for label in SENTIMENT_LABELS})
+        self._group_index = {}
+        self._speaker_names = {}
+        self._doc_groups = array('I')
+        self._token_ids = array('I')
+        self._offsets = array('q', [0])
+        self._group_terms = None
+
+    def add(self, scene, speaker, tokens):
+        """累加一条对话的分词结果"""
+        self.add_ids(scene, speaker, self.vocabulary.encode(tokens), tokens)
+
+    def add_ids(self, scene, speaker, token_ids, tokens=None):
+        """累加一条已转换为词ID（属于 self.vocabulary）的对话，tokens 为对应的分词结果，省略时由词表还原"""
+        key = (scene, self._speaker_names.setdefault(speaker_key(speaker), speaker))
+        group = self._group_index.get(key)
+        if group is None:
+            group = self._group_index[key] = len(self.groups)
+            self.groups.append(key)
+        self._doc_groups.append(group)
+        self._token_ids.extend(token_ids)
+        self._offsets.append(len(self._token_ids))
+        self._group_terms = None
+
+        if tokens is None:
+            tokens = self.vocabulary.decode(token_ids)
+        for word, label in sentiment_hits(self.matcher, tokens):
+            self.sentiment[key][label][word] += 1
+
+    @property
+    def scenes(self):
+        return sorted({scene for scene, _ in self.groups})
+
+    @property
+    def speakers(self):
+        return sorted({speaker for _, speaker in self.groups})
+
+    def _group_mask(self, scene=None, speakers=None):
+        keys = None if speakers is None else {speaker_key(speaker) for speaker in speakers}
+        return np.array([(scene is None or group_scene == scene) and (keys is None or speaker_key(group_speaker) in keys)
+                         for group_scene, group_speaker in self.groups], dtype=bool)
+
+    def _term_matrix(self):
+        """各分组的词频（稀疏形式）：(分组序号, 词ID, 次数) 三个数组，添加对话后重新计算"""
+        if self._group_terms is None:
+            lengths = np.diff(np.array(self._offsets, dtype=np.int64))
+            groups = np.repeat(np.array(self._doc_groups, dtype=np.int64), lengths)
+            n_terms = max(len(self.vocabulary), 1)
+            keys, counts = np.unique(groups * n_terms + np.array(self._token_ids, dtype=np.int64),
+                                     return_counts=True)
+            self._group_terms = (keys // n_terms, keys % n_terms, counts)
+        return self._group_terms
+
+    def frequencies(self, scene=None, speakers=None):
+        """
+        合并符合条件的分组，得到内容词（非停用词、非纯数字）的词频
+
+        参数:
+        scene: 只统计该场景，为None时统计全部场景
+        speakers: 只统计这些角色（不区分大小写），为None时统计全部角色
+        """
+        if not self.groups:
+            return {}
+        group_rows, term_ids, counts = self._term_matrix()
+        selected = self._group_mask(scene, speakers)[group_rows]
+        totals = np.bincount(term_ids[selected], weights=counts[selected], minlength=len(self.vocabulary))
+        totals *= self.vocabulary.content_mask(self.stopwords)
+        return frequencies_from_array(self.vocabulary.terms, totals)
+
+    def sentiment_frequencies(self, label, scene=None, speakers=None):
+        """合并符合条件的分组，得到某类情感词的命中次数"""
+        total = Counter()
+        keys = None if speakers is None else {speaker_key(speaker) for speaker in speakers}
+        for (group_scene, group_speaker), hits in self.sentiment.items():
+            if scene is not None and group_scene != scene:
+                continue
+            if keys is not None and speaker_key(group_speaker) not in keys:
+                continue
+            total.update(hits[label])
+        return {word: float(count) for word, count in total.items() if word not in self.stopwords}
+
+
+def count_folder(counts, input_folder, token_cache=None, workers=1):
+    """解析对话文件夹中所有角色的对话，分词后按（场景, 角色）累加到 counts"""
+    # iter_line_tokens 按输入顺序产出结果，分组键按读取顺序排队，与分词结果一一对应
+    keys = deque()
+
+    def lines():
+        for scene, _, _, speaker, _, text in iter_folder_turns(input_folder):
+            keys.append((scene, speaker))
+            yield clean_text(text).replace('\n', ' ')
+
+    for tokens in iter_line_tokens(lines(), token_cache, workers):
+        counts.add(*keys.popleft(), tokens)
+    return counts
+
+
+def count_store(counts, store_path):
+    """从 dialogue_store 生成的列式存储读取已分好的词ID，不再重新分词"""
+    from dialogue_store import load_vocabulary, open_store
+
+    # 存储的词ID一次性映射到 counts 的词表（counts 为空时即为恒等映射）
+    store_terms = load_vocabulary(store_path).terms
+    mapping = np.array([counts.vocabulary.add(term) for term in store_terms], dtype=np.uint32)
+    table = open_store(store_path, ['scene', 'speaker', 'token_ids'])
+    for batch in table.to_batches():
+        token_lists = batch.column('token_ids')
+        offsets = np.asarray(token_lists.offsets)
+        token_ids = mapping[token_lists.values.to_numpy()]
+        for row, (scene, speaker) in enumerate(zip(batch.column('scene').to_pylist(),
+                                                   batch.column('speaker').to_pylist())):
+            counts.add_ids(scene, speaker, token_ids[offsets[row]:offsets[row + 1]])
+    return counts
+
+
+def _cloud_name(name):
+    """把场景路径或角色名转换为安全的文件名"""
+    name = os.path.splitext(name)[0] if name.endswith('.txt') else name
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name).strip('_') or 'unnamed'
+
+
+def plan_clouds(counts, output_dir, speakers=DEFAULT_SPEAKERS):
+    """
+    由分组计数得出所有词云的词频
+
+    总体、积极、消极和每个场景的词云只统计 speakers 的对话，每个角色的词云覆盖语料中的全部角色
+
+    返回:
+    dict: 输出路径到词频的映射（跳过没有词语的词云）
+    """
+    speakers = set(speakers)
+    clouds = {
+        os.path.join(output_dir, 'wordcloud.png'): counts.frequencies(speakers=speakers),
+        os.path.join(output_dir, 'positive_wordcloud.png'): counts.sentiment_frequencies('positive', speakers=speakers),
+        os.path.join(output_dir, 'negative_wordcloud.png'): counts.sentiment_frequencies('negative', speakers=speakers),
+    }
+    for scene in counts.scenes:
+        path = os.path.join(output_dir, 'scenes', _cloud_name(scene) + '.png')
+        clouds[path] = counts.frequencies(scene=scene, speakers=speakers)
+    for speaker in counts.speakers:
+        path = os.path.join(output_dir, 'speakers', _cloud_name(speaker) + '.png')
+        clouds[path] = counts.frequencies(speakers={speaker})
+    return {path: frequencies for path, frequencies in clouds.items() if frequencies}
+
+
+def _render_job(job):
+    from word_cloud_generator import render_word_cloud
+
+    path, frequencies, options = job
+    render_word_cloud(frequencies, output=path, **options)
+    return path
+
+
+def render_clouds(clouds, workers=1, **options):
+    """
+    并行渲染多张词云
+
+    参数:
+    clouds: 输出路径到词频的映射
+    workers: 渲染进程数，1为串行，0表示使用全部CPU核心
+    options: 传给 render_word_cloud 的参数，如 preset、mask_path、layout
+
+    产出:
+    已写入的图片路径（并行时按完成先后）
+    """
+    for path in clouds:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    jobs = [(path, frequencies, options) for path, frequencies in clouds.items()]
+
+    workers = min(resolve_workers(workers), len(jobs))
+    if workers <= 1:
+        for job in jobs:
+            yield _render_job(job)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(_render_job, jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成总体、积极、消极、分场景和分角色词云")
+    parser.add_argument('input_folder', nargs='?', default='Caleb_data', help="对话文件夹（默认Caleb_data）")
+    parser.add_argument('--store', help="改为从 dialogue_store 生成的列式存储读取已分好的词")
+    parser.add_argument('-o', '--output-dir', default='analysis_results', help="输出目录（默认analysis_results）")
+    parser.add_argument('--speakers', nargs='+', default=list(DEFAULT_SPEAKERS),
+                        help="总体、情感和分场景词云统计的角色（默认Caleb）")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help="分词和渲染的进程数，0表示使用全部CPU核心（默认0）")
+    parser.add_argument('--preset', choices=sorted(RENDER_PRESETS), help="渲染预设，如 thumbnail")
+    parser.add_argument('--mask', dest='mask_path', help="词云形状模板")
+    parser.add_argument('--layout', choices=LAYOUT_ENGINES, default='wordcloud',
+                        help="布局引擎，fast 在词多、画布大时快得多（默认wordcloud）")
+    args = parser.parse_args()
+
+    matcher = sentiment_matcher(load_word_list('positive_words.txt', DEFAULT_POSITIVE_WORDS),
+                                load_word_list('negative_words.txt', DEFAULT_NEGATIVE_WORDS))
+    counts = CorpusCounts(matcher, load_word_list('stopwords.txt', DEFAULT_STOPWORDS))
+    if args.store:
+        count_store(counts, args.store)
+    else:
+        from jieba_dict_cache import load_jieba
+        from token_cache import TokenCache
+
+        load_jieba()
+        with TokenCache() as token_cache:
+            count_folder(counts, args.input_folder, token_cache, args.workers)
+
+    clouds = plan_clouds(counts, args.output_dir, args.speakers)
+    print(f"共 {len(counts.scenes)} 个场景、{len(counts.speakers)} 个角色，生成 {len(clouds)} 张词云")
+    for path in render_clouds(clouds, args.workers, preset=args.preset, mask_path=args.mask_path,
+                               layout=args.layout):
+        print(f"词云已保存到: {path}")
+
+
+if __name__ == "__main__":
+    main()
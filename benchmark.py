@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+性能基准测试
+功能：生成确定性的合成对话语料（与Caleb_data格式相同：中英文冒号混用，夹杂.jpg表情包行），
+      分阶段测量对话提取、清理分词、词云渲染和重复渲染的内存稳定性，
+      以JSON输出每个阶段的吞吐量、p50/p99延迟和峰值内存，便于在不同版本之间对比
+
+每个阶段在独立的spawn子进程中运行，峰值内存互不影响
+
+用法:
+python benchmark.py --size 10MB --output bench.json
+python benchmark.py --size 1GB --stages extract segment
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+from pipeline_metrics import current_rss_bytes, peak_rss_bytes
+
+DEFAULT_CORPUS_DIR = os.path.join('.cache', 'bench_corpus')
+DEFAULT_WORK_DIR = os.path.join('.cache', 'bench_work')
+
+STAGES = ('extract', 'segment', 'render', 'render_memory')
+
+# 合成语料使用的词语，覆盖常见的日常对话用词
+CORPUS_WORDS = (
+    '今天', '明天', '晚上', '电影', '电影院', '游乐园', '小鸟', '任务', '基地', '训练', '飞行',
+    '项链', '礼物', '喜欢', '开心', '担心', '累', '想念', '一起', '回家', '吃饭', '做饭', '天气',
+    '下雨', '散步', '看看', '等你', '消息', '联系', '通知', '休息', '工作', '忙', '有点', '怪',
+    '真的', '好像', '其实', '所以', '不过', '还是', '已经', '马上', '一会儿', '你', '我', '他',
+    '我们', '的', '了', '吗', '吧', '呢', '啊', 'OK', 'Caleb', 'nice', 'game',
+)
+SPEAKERS = ('Caleb', 'Caleb', 'Caleb', 'Caleb', 'Caleb', '我', '我', '我', '我', '奶奶', '夏以昼')
+SEPARATORS = ('：', ':', ': ', '： ')
+STICKERS = ('[表情]思考.jpg', '[表情]开心.jpg', '图片', 'photo.png', '猫猫点头.jpg')
+PUNCTUATION = ('', '', '，', '。', '？', '！', '……')
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+# 延迟直方图的最小可分辨值（秒）和相邻桶的相对宽度，分位数的相对误差不超过该宽度
+HISTOGRAM_MIN_SECONDS = 1e-7
+HISTOGRAM_PRECISION = 0.01
+
+
+def parse_size(text):
+    """把 '10MB'、'1GB' 之类的字符串转换为字节数"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]B)?\s*', text, re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"无法识别的大小: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS.get((match.group(2) or '').upper(), 1))
+
+
+def synthetic_line(rng):
+    """生成一行合成对话"""
+    roll = rng.random()
+    if roll < 0.02:
+        return f"——第{rng.randint(1, 999)}天——"
+    speaker = rng.choice(SPEAKERS)
+    separator = rng.choice(SEPARATORS)
+    if roll < 0.06:
+        return speaker + separator + rng.choice(STICKERS)
+    words = rng.choices(CORPUS_WORDS, k=rng.randint(3, 14))
+    return speaker + separator + ''.join(words) + rng.choice(PUNCTUATION)
+
+
+def generate_corpus(output_dir, size_bytes, seed=0, file_bytes=1024 ** 2):
+    """
+    生成确定性的合成语料：相同的 size_bytes、seed 和 file_bytes 总是得到相同的文件
+
+    每100个文件放在一个子文件夹中，以覆盖递归遍历
+
+    返回:
+    int: 生成的文件数
+    """
+    rng = random.Random(seed)
+    written = 0
+    n_files = 0
+    while written < size_bytes:
+        directory = os.path.join(output_dir, f'part_{n_files // 100:04d}')
+        os.makedirs(directory, exist_ok=True)
+        target = min(file_bytes, size_bytes - written)
+        lines = []
+        file_size = 0
+        while file_size < target:
+            line = synthetic_line(rng) + '\n'
+            lines.append(line)
+            file_size += len(line.encode('utf-8'))
+        with open(os.path.join(directory, f'scene_{n_files:06d}.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        written += file_size
+        n_files += 1
+    return n_files
+
+
+def ensure_corpus(corpus_dir, size_bytes, seed):
+    """
+    语料已按相同参数生成过时直接复用，否则重新生成
+
+    只会删除本脚本生成的目录（含有 corpus.json）；目录非空又没有 corpus.json 时报错，不改动其中的文件
+    """
+    meta_path = os.path.join(corpus_dir, 'corpus.json')
+    meta = {'size_bytes': size_bytes, 'seed': seed}
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                return
+    except (OSError, ValueError):
+        pass
+
+    if os.path.isdir(corpus_dir) and os.listdir(corpus_dir) and not os.path.exists(meta_path):
+        raise ValueError(f"{corpus_dir} 不是基准测试生成的语料目录（没有 corpus.json），请指定空目录或新目录")
+
+    import shutil
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    print(f"生成合成语料: {size_bytes / SIZE_UNITS['MB']:.1f} MB -> {corpus_dir}", file=sys.stderr)
+    # 先写入未完成的标记，生成中断后的目录仍可识别为本脚本所有，下次直接重新生成
+    os.makedirs(corpus_dir, exist_ok=True)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, complete=False), f)
+    generate_corpus(corpus_dir, size_bytes, seed)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+class LatencyHistogram:
+    """
+    流式的延迟直方图：按对数宽度分桶计数，内存占用与记录次数无关
+
+    分位数取所在桶的上界（不超过记录到的最大值），相对误差不超过 precision
+
+    参数:
+    precision: 相邻桶边界的相对宽度
+    """
+
+    def __init__(self, precision=HISTOGRAM_PRECISION):
+        self._log_base = math.log1p(precision)
+        self._buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        # 第 index 个桶收录 (MIN * (1 + precision) ** (index - 1), MIN * (1 + precision) ** index] 之间的值
+        ratio = max(seconds, HISTOGRAM_MIN_SECONDS) / HISTOGRAM_MIN_SECONDS
+        index = max(0, math.ceil(math.log(ratio) / self._log_base))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """最近秩法计算分位数（秒），没有记录时返回None"""
+        if not self.count:
+            return None
+        rank = max(1, min(self.count, math.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(HISTOGRAM_MIN_SECONDS * math.exp(index * self._log_base), self.max)
+        return self.max
+
+
+def summarize(latencies, seconds, items, n_bytes=None):
+    """把一个阶段的延迟直方图（LatencyHistogram）汇总成统计结果"""
+    result = {
+        'items': items,
+        'seconds': round(seconds, 6),
+        'items_per_s': round(items / seconds, 3) if seconds else None,
+        'p50_ms': round(latencies.percentile(50) * 1000, 4) if latencies.count else None,
+        'p99_ms': round(latencies.percentile(99) * 1000, 4) if latencies.count else None,
+    }
+    if n_bytes is not None:
+        result['bytes'] = n_bytes
+        result['mb_per_s'] = round(n_bytes / SIZE_UNITS['MB'] / seconds, 3) if seconds else None
+    return result
+
+
+def _dialogues_file(config):
+    """提取阶段的输出；单独运行后续阶段时先（不计时）生成它"""
+    path = os.path.join(config['work_dir'], 'caleb_dialogues.txt')
+    if not os.path.exists(path):
+        from dialogue_extractor import extract_dialogues
+
+        extract_dialogues(config['corpus_dir'], {'Caleb': path})
+    return path
+
+
+def stage_extract(config):
+    """对话提取：逐文件计时，吞吐量按语料字节数计算"""
+    from dialogue_extractor import compile_speaker_pattern, iter_file_dialogues, iter_source_files
+
+    pattern = compile_speaker_pattern(['Caleb'])
+    canonical_names = {'caleb': 'Caleb'}
+    output_path = os.path.join(config['work_dir'], 'caleb_dialogues.txt')
+    latencies = LatencyHistogram()
+    n_bytes = 0
+
+    started = time.perf_counter()
+    with open(output_path, 'w', encoding='utf-8') as sink:
+        for file_path in iter_source_files(config['corpus_dir']):
+            file_started = time.perf_counter()
+            for _, dialogue in iter_file_dialogues(file_path, pattern, canonical_names):
+                sink.write(dialogue + '\n')
+            latencies.add(time.perf_counter() - file_started)
+            n_bytes += os.path.getsize(file_path)
+    return summarize(latencies, time.perf_counter() - started, latencies.count, n_bytes)
+
+
+def stage_segment(config):
+    """清理文本并用jieba分词（不使用分词缓存）：逐行计时"""
+    from jieba_dict_cache import load_jieba
+    from token_cache import segment_line
+    from word_cloud_generator import clean_text
+
+    path = _dialogues_file(config)
+    load_jieba()
+    latencies = LatencyHistogram()
+    n_bytes = 0
+
+    started = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line_started = time.perf_counter()
+            segment_line(clean_text(line))
+            latencies.add(time.perf_counter() - line_started)
+            n_bytes += len(line.encode('utf-8'))
+    return summarize(latencies, time.perf_counter() - started, latencies.count, n_bytes)
+
+
+def _render_frequencies(config):
+    from jieba_dict_cache import load_jieba
+    from token_cache import count_line_tokens
+    from word_cloud_generator import clean_text, count_tokens
+
+    load_jieba()
+    with open(_dialogues_file(config), 'r', encoding='utf-8') as f:
+        lines = [clean_text(line) for _, line in zip(range(config['render_lines']), f)]
+    return count_tokens((), counter=count_line_tokens(lines))
+
+
+def stage_render(config):
+    """完整尺寸词云的布局和PNG编码：逐次计时"""
+    from word_cloud_generator import render_word_cloud
+
+    frequencies = _render_frequencies(config)
+    options = {'font_path': config['font_path']} if config['font_path'] else {}
+    latencies = LatencyHistogram()
+
+    started = time.perf_counter()
+    for _ in range(config['renders']):
+        render_started = time.perf_counter()
+        render_word_cloud(frequencies, **options)
+        latencies.add(time.perf_counter() - render_started)
+    return summarize(latencies, time.perf_counter() - started, latencies.count)
+
+
+def stage_render_memory(config):
+    """重复渲染缩略图，检查常驻内存是否保持平稳（没有随渲染次数增长）"""
+    from word_cloud_generator import render_word_cloud
+
+    frequencies = _render_frequencies(config)
+    options = {'font_path': config['font_path']} if config['font_path'] else {}
+    latencies = LatencyHistogram()
+    # 跳过前10%的预热阶段（首次导入、缓存建立），比较之后的内存变化；只保留这两个采样点
+    warmup = config['memory_renders'] // 10
+    rss_after_warmup = rss_final = None
+
+    started = time.perf_counter()
+    for i in range(config['memory_renders']):
+        render_started = time.perf_counter()
+        render_word_cloud(frequencies, preset='thumbnail', **options)
+        latencies.add(time.perf_counter() - render_started)
+        rss_final = current_rss_bytes()
+        if i == warmup:
+            rss_after_warmup = rss_final
+    result = summarize(latencies, time.perf_counter() - started, latencies.count)
+
+    if rss_after_warmup is not None:
+        result['rss_after_warmup_bytes'] = rss_after_warmup
+        result['rss_final_bytes'] = rss_final
+        result['rss_growth_bytes'] = rss_final - rss_after_warmup
+    return result
+
+
+STAGE_FUNCTIONS = {
+    'extract': stage_extract,
+    'segment': stage_segment,
+    'render': stage_render,
+    'render_memory': stage_render_memory,
+}
+
+
+def _run_stage(name, config):
+    """子进程入口：运行一个阶段并附上该进程的峰值内存"""
+    result = STAGE_FUNCTIONS[name](config)
+    result['peak_rss_bytes'] = peak_rss_bytes()
+    return result
+
+
+def run_benchmark(stages, config):
+    """
+    依次在全新的spawn子进程中运行各阶段
+
+    返回:
+    dict: 阶段名到统计结果的映射
+    """
+    os.makedirs(config['work_dir'], exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in stages:
+        print(f"运行阶段: {name}", file=sys.stderr)
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_run_stage, (name, config))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话提取、分词和词云渲染的性能基准测试")
+    parser.add_argument('--size', type=parse_size, default=parse_size('10MB'),
+                        help="合成语料大小，如 1MB、100MB、1GB（默认10MB）")
+    parser.add_argument('--seed', type=int, default=0, help="语料生成的随机种子（默认0）")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help="要运行的阶段")
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR, help=f"语料目录（默认{DEFAULT_CORPUS_DIR}）")
+    parser.add_argument('--renders', type=int, default=5, help="render 阶段的渲染次数（默认5）")
+    parser.add_argument('--memory-renders', type=int, default=200,
+                        help="render_memory 阶段的渲染次数（默认200）")
+    parser.add_argument('--render-lines', type=int, default=20000,
+                        help="用于统计渲染词频的对话行数（默认20000）")
+    parser.add_argument('--font-path', help="渲染使用的字体（默认使用词云生成器的默认字体）")
+    parser.add_argument('-o', '--output', help="把JSON结果写入文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    try:
+        ensure_corpus(args.corpus_dir, args.size, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    # 中间结果按语料目录和语料参数分开存放，换语料后不会误用旧的提取结果
+    corpus_key = hashlib.sha1(os.path.abspath(args.corpus_dir).encode('utf-8')).hexdigest()[:12]
+    config = {
+        'corpus_dir': args.corpus_dir,
+        'work_dir': os.path.join(DEFAULT_WORK_DIR, f'{corpus_key}-{args.size}-{args.seed}'),
+        'renders': args.renders,
+        'memory_renders': args.memory_renders,
+        'render_lines': args.render_lines,
+        'font_path': args.font_path,
+    }
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus_bytes': args.size,
+            'seed': args.seed,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'stages': run_benchmark(args.stages, config),
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"基准测试结果已保存到: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ Caleb对话分析完整解决方案
 import os
 import sys
 
+from dialogue_extractor import iter_source_files
+
 def main():
     # 检查Python环境
     print("当前Python版本:", sys.version)
@@ -22,15 +24,15 @@ def main():
         print(f"错误: 找不到目录 {caleb_data_dir}")
         return
     
-    # 列出可用的对话文件
+    # 列出可用的对话文件（包括子文件夹）
     print("\nCaleb_data文件夹中的文件:")
     try:
-        files = os.listdir(caleb_data_dir)
+        files = list(iter_source_files(caleb_data_dir))
         if not files:
             print("  文件夹为空")
         else:
             for file in files:
-                print(f"  - {file}")
+                print(f"  - {os.path.relpath(file, caleb_data_dir)}")
     except Exception as e:
         print(f"  读取目录时出错: {e}")
     
@@ -113,32 +115,44 @@ A: 确保已安装所需依赖：pip install jieba wordcloud matplotlib
     sample_code = '''
 # 手动提取Caleb对话的代码示例
 import os
+from multiprocessing import Pool
 
 caleb_data_dir = "Caleb_data"
 output_file = "caleb_dialogues.txt"
-caleb_dialogues = []
-
-for filename in os.listdir(caleb_data_dir):
-    if filename.endswith('.txt'):
-        file_path = os.path.join(caleb_data_dir, filename)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('Caleb：'):
-                        content = line.split('：', 1)[1].strip()
-                        caleb_dialogues.append(content)
-                    elif line.startswith('Caleb:'):
-                        content = line.split(':', 1)[1].strip()
-                        caleb_dialogues.append(content)
-        except Exception as e:
-            print(f"读取文件 {filename} 时出错: {e}")
-
-with open(output_file, 'w', encoding='utf-8') as f:
-    for dialogue in caleb_dialogues:
-        f.write(dialogue + '\n')
-
-print(f"已提取 {len(caleb_dialogues)} 条Caleb的对话")
+workers = os.cpu_count() or 1  # 并行进程数，设为1即串行
+
+def extract_file(file_path):
+    dialogues = []
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('Caleb：'):
+                    dialogues.append(line.split('：', 1)[1].strip())
+                elif line.startswith('Caleb:'):
+                    dialogues.append(line.split(':', 1)[1].strip())
+    except Exception as e:
+        print(f"读取文件 {file_path} 时出错: {e}")
+    return dialogues
+
+if __name__ == '__main__':
+    # 递归收集所有txt文件，排序后结果可复现
+    file_paths = []
+    for root, dirs, files in os.walk(caleb_data_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.txt'):
+                file_paths.append(os.path.join(root, filename))
+
+    caleb_count = 0
+    with Pool(workers) as pool, open(output_file, 'w', encoding='utf-8') as f:
+        # imap 按提交顺序返回结果，并行输出与串行一致
+        for dialogues in pool.imap(extract_file, file_paths, chunksize=16):
+            for dialogue in dialogues:
+                f.write(dialogue + '\n')
+            caleb_count += len(dialogues)
+
+    print(f"已提取 {caleb_count} 条Caleb的对话")
 '''
     
     with open("manual_extraction_example.py", "w", encoding="utf-8") as f:
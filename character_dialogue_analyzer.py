@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+角色对话分析工具
+功能：加载角色对话，进行情感分析、TF-IDF关键词提取，并生成总体/积极/消极词云
+      所有对话只分词一次，构建成稀疏的文档-词矩阵，关键词和词云都由该矩阵计算；
+      情感词典编译成多模式匹配自动机，分词的同时一遍扫描找出情感词和跨词的情感短语
+作者：runyoung
+版本：1.0
+"""
+
+import csv
+import json
+import os
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+import numpy as np
+
+from lexicon_matcher import load_matcher
+from pipeline_metrics import measure
+from token_cache import iter_line_tokens
+from token_corpus import TokenCorpus
+from word_cloud_generator import clean_text, generate_word_cloud_from_frequencies
+
+# 内置情感词典，可通过 positive_words.txt / negative_words.txt 扩展
+DEFAULT_POSITIVE_WORDS = {
+    '喜欢', '开心', '高兴', '快乐', '幸福', '温暖', '感谢', '谢谢', '喜悦', '满意',
+    '美好', '特别', '信心', '希望', '陪伴', '支持', '放心', '安心', '好看', '漂亮',
+    '可爱', '厉害', '优秀', '成功', '期待', '舒服', '轻松', '甜', '爱', '好',
+    '珍惜', '想念', '保护', '相信', '勇敢', '温柔', '心意', '一起',
+}
+DEFAULT_NEGATIVE_WORDS = {
+    '难过', '伤心', '痛苦', '生气', '讨厌', '害怕', '担心', '失望', '孤单', '寂寞',
+    '烦', '累', '痛', '哭', '怕', '糟糕', '不好', '后悔', '遗憾', '紧张',
+    '焦虑', '无聊', '危险', '受伤', '麻烦', '可惜', '抱歉', '对不起', '不够', '失去',
+    '离开', '错过', '吵架', '委屈',
+}
+DEFAULT_STOPWORDS = {
+    '的', '了', '吗', '吧', '呢', '啊', '呀', '哦', '嗯', '是', '在', '和', '也', '就',
+    '都', '而', '及', '与', '着', '或', '一个', '没有', '我们', '你们', '他们', '她们',
+    '这', '那', '这个', '那个', '什么', '怎么', '还', '又', '把', '被', '让', '给', '对',
+    '会', '要', '能', '去', '来', '到', '说', '看', '得', '地', '很', '有', '不', '人',
+}
+
+# 情感词典的标签，同一个词同时出现在两个词典中时以积极词典为准
+SENTIMENT_LABELS = ('positive', 'negative')
+
+# 支持的JSON字段名称
+JSON_TEXT_FIELDS = ('dialogue', 'text', 'content', 'quote')
+
+# save_results 写入 output_dir 的文件名，report_generator 由它生成HTML报告
+RESULTS_FILE = 'results.json'
+
+
+def load_word_list(path, default=()):
+    """读取词表文件（每行一个词），文件不存在时只使用默认词表"""
+    words = set(default)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            words.update(line.strip() for line in f if line.strip())
+    return words
+
+
+def sentiment_hits(matcher, tokens):
+    """
+    在一条对话的分词结果上匹配情感词典
+
+    匹配在整句上进行，可以找到被分词拆开的短语（如“不开心”）；只保留起止位置
+    都落在分词边界上的命中，单字词不会误中其他词的一部分（如“好”之于“好像”）
+
+    返回:
+    list: (词语, 标签) 列表
+    """
+    boundaries = set(accumulate(map(len, tokens), initial=0))
+    return [(word, label) for _, _, word, label in matcher.find_longest(''.join(tokens), boundaries)]
+
+
+def sentiment_matcher(positive_words, negative_words):
+    """编译情感词典，词典不变时从磁盘缓存加载"""
+    return load_matcher({'positive': positive_words, 'negative': negative_words})
+
+
+class DocumentTermMatrix:
+    """
+    CSR格式的稀疏文档-词矩阵
+
+    第d条对话的词为 indices[indptr[d]:indptr[d+1]]，对应次数为 data[indptr[d]:indptr[d+1]]，
+    rows 给出每个非零元素所属的对话
+
+    参数:
+    corpus: TokenCorpus，词ID数组形式的语料
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.vocabulary = corpus.vocabulary.terms
+        self.term_ids = corpus.vocabulary.ids
+        self.doc_lengths = corpus.doc_lengths.astype(np.int64)
+
+        # 按 (对话, 词) 合并重复出现的词
+        n_docs, n_terms = len(self.doc_lengths), max(len(self.vocabulary), 1)
+        ids = corpus.token_ids.astype(np.int64)
+        keys, counts = np.unique(corpus.token_rows() * n_terms + ids, return_counts=True)
+        doc_of_entry = keys // n_terms
+
+        self.indices = keys % n_terms
+        self.data = counts
+        self.indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_of_entry, minlength=n_docs), out=self.indptr[1:])
+        self.rows = doc_of_entry
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lengths)
+
+    def term_mask(self, words):
+        """把词集合转换为按词ID索引的布尔数组，每个词表只需查找一次"""
+        return self.corpus.vocabulary.mask(words)
+
+    def row_sums(self, mask):
+        """每条对话中属于 mask 的词出现的总次数"""
+        weights = self.data * mask[self.indices]
+        return np.bincount(self.rows, weights=weights, minlength=self.n_docs)
+
+    def term_totals(self, doc_weights=None):
+        """每个词在全部对话中出现的总次数，提供 doc_weights 时每条对话按其权重（出现次数）计"""
+        weights = self.data if doc_weights is None else self.data * doc_weights[self.rows]
+        return np.bincount(self.indices, weights=weights, minlength=len(self.vocabulary))
+
+    def document_frequencies(self, doc_weights=None):
+        """每个词出现在多少条对话中，提供 doc_weights 时每条对话按其权重计"""
+        return np.bincount(self.indices, weights=None if doc_weights is None else doc_weights[self.rows],
+                           minlength=len(self.vocabulary))
+
+
+class CharacterDialogueAnalyzer:
+    """
+    角色对话分析器
+
+    参数:
+    output_dir: 分析结果（词云图片）的保存目录
+    token_cache: TokenCache 实例，提供时复用已缓存的分词结果
+    positive_words_file / negative_words_file / stopwords_file: 扩展词典文件路径
+    """
+
+    def __init__(self, output_dir='analysis_results', token_cache=None,
+                 positive_words_file='positive_words.txt',
+                 negative_words_file='negative_words.txt',
+                 stopwords_file='stopwords.txt'):
+        self.output_dir = output_dir
+        self.token_cache = token_cache
+        self.positive_words = load_word_list(positive_words_file, DEFAULT_POSITIVE_WORDS)
+        self.negative_words = load_word_list(negative_words_file, DEFAULT_NEGATIVE_WORDS)
+        self.stopwords = load_word_list(stopwords_file, DEFAULT_STOPWORDS)
+
+        self.dialogues = []
+        # 去重后每条对话的出现次数（NumPy数组），未去重时为None，即每条对话计一次
+        self.dialogue_weights = None
+        self.source_file = None
+        self.results = {}
+        self._matrix = None
+        self._lexicon_matcher = None
+        self._sentiment_counts = None
+        self._sentiment_hits = None
+
+    def load_dialogues_from_file(self, file_path, speaker=None):
+        """
+        从文件加载对话，支持TXT（每行一条）、CSV（dialogue列）、JSON格式
+        以及 dialogue_store 生成的列式存储（.arrow/.feather）
+
+        参数:
+        file_path: 对话文件路径
+        speaker: 读取列式存储时只加载该角色的对话，为None时加载全部
+
+        返回:
+        bool: 是否成功加载到至少一条对话
+        """
+        try:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension == '.csv':
+                dialogues = self._load_csv(file_path)
+            elif extension == '.json':
+                dialogues = self._load_json(file_path)
+            elif extension in ('.arrow', '.feather'):
+                from dialogue_store import read_dialogues
+
+                dialogues = read_dialogues(file_path, columns=['text'], speaker=speaker)['text'].tolist()
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    dialogues = [line.strip() for line in f]
+        except (OSError, UnicodeDecodeError, ValueError, KeyError) as e:
+            print(f"加载对话文件{file_path}时出错: {str(e)}")
+            return False
+
+        self.dialogues = [dialogue for dialogue in dialogues if dialogue]
+        self.dialogue_weights = None
+        self.source_file = file_path
+        self.results = {}
+        self._matrix = None
+        print(f"已加载 {len(self.dialogues)} 条对话")
+        return bool(self.dialogues)
+
+    def _load_csv(self, file_path):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            return [str(row['dialogue']).strip() for row in csv.DictReader(f)]
+
+    def _load_json(self, file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            # 形如 {"dialogues": [...]} 的结构，取第一个列表字段
+            data = next((value for value in data.values() if isinstance(value, list)), [])
+
+        dialogues = []
+        for item in data:
+            if isinstance(item, str):
+                dialogues.append(item.strip())
+            elif isinstance(item, dict):
+                field = next((name for name in JSON_TEXT_FIELDS if name in item), None)
+                if field:
+                    dialogues.append(str(item[field]).strip())
+        return dialogues
+
+    def deduplicate(self, threshold=None, near=True):
+        """
+        合并重复和近似重复的对话（见 dedup.py），之后分词和情感匹配只对每条唯一对话做一次，
+        情感统计、关键词和词云按每条对话的出现次数加权
+
+        参数:
+        threshold: 近似重复阈值，为None时使用 dedup.DEFAULT_THRESHOLD
+        near: 为False时只合并完全相同的对话
+
+        返回:
+        int: 去重后的对话数量
+        """
+        from dedup import DEFAULT_THRESHOLD, dedupe
+
+        deduplicator = dedupe(self.dialogues, DEFAULT_THRESHOLD if threshold is None else threshold, near)
+        self.dialogues = deduplicator.texts
+        self.dialogue_weights = np.frombuffer(deduplicator.counts, dtype=deduplicator.counts.typecode).astype(np.int64)
+        self.results = {}
+        self._matrix = None
+        print(f"去重后保留 {len(self.dialogues)} 条对话"
+              f"（完全重复 {deduplicator.n_exact} 条，近似重复 {deduplicator.n_near} 条）")
+        return len(self.dialogues)
+
+    @property
+    def lexicon_matcher(self):
+        """编译好的情感词典匹配器，词典不变时从磁盘缓存加载"""
+        if self._lexicon_matcher is None:
+            self._lexicon_matcher = sentiment_matcher(self.positive_words, self.negative_words)
+        return self._lexicon_matcher
+
+    def build_matrix(self):
+        """
+        分词并构建全部对话的文档-词矩阵（词ID语料），同时匹配情感词典；已构建时直接返回
+
+        返回:
+        DocumentTermMatrix: 之后各项分析共用的矩阵
+        """
+        if self._matrix is None:
+            lines = (clean_text(dialogue).replace('\n', ' ') for dialogue in self.dialogues)
+            self._sentiment_counts = {label: array('l') for label in SENTIMENT_LABELS}
+            self._sentiment_hits = {label: Counter() for label in SENTIMENT_LABELS}
+            corpus = TokenCorpus.build(self._match_sentiment(iter_line_tokens(lines, self.token_cache)))
+            self._matrix = DocumentTermMatrix(corpus)
+        return self._matrix
+
+    @property
+    def matrix(self):
+        """全部对话的文档-词矩阵，尚未构建时调用 build_matrix"""
+        return self.build_matrix()
+
+    @property
+    def corpus(self):
+        """全部对话的词ID语料（TokenCorpus），可用 save 写入磁盘供其他阶段内存映射读取"""
+        return self.matrix.corpus
+
+    def _match_sentiment(self, token_lists):
+        """在分词结果流过时匹配情感词典（见 sentiment_hits），原样产出每条对话的分词列表"""
+        matcher = self.lexicon_matcher
+        weights = self.dialogue_weights
+        for index, tokens in enumerate(token_lists):
+            weight = 1 if weights is None else int(weights[index])
+            counts = dict.fromkeys(SENTIMENT_LABELS, 0)
+            for word, label in sentiment_hits(matcher, tokens):
+                counts[label] += 1
+                self._sentiment_hits[label][word] += weight
+            for label in SENTIMENT_LABELS:
+                self._sentiment_counts[label].append(counts[label])
+            yield tokens
+
+    def _content_mask(self):
+        """可作为关键词和词云内容的词：非停用词且不是纯数字"""
+        return self.matrix.corpus.vocabulary.content_mask(self.stopwords)
+
+    def analyze_sentiment(self):
+        """
+        基于情感词典计算每条对话的情感得分：(积极词数 - 消极词数) / 总词数
+
+        一个情感短语无论被分成几个词都只计一次；去重后每条对话按出现次数计入数量、比例和平均得分
+
+        返回:
+        dict: 积极/消极/中性对话的数量和比例、平均得分以及每条（唯一）对话的得分
+        """
+        matrix = self.matrix
+        positive, negative = (np.frombuffer(counts, dtype=counts.typecode).astype(np.int64)
+                              for counts in (self._sentiment_counts[label] for label in SENTIMENT_LABELS))
+        totals = matrix.doc_lengths
+        scores = np.divide(positive - negative, totals, out=np.zeros(matrix.n_docs), where=totals > 0)
+        weights = self.dialogue_weights if self.dialogue_weights is not None else np.ones(matrix.n_docs, dtype=np.int64)
+
+        total_weight = int(weights.sum())
+        n_docs = max(total_weight, 1)
+        result = {
+            'positive': int(weights[scores > 0].sum()),
+            'negative': int(weights[scores < 0].sum()),
+            'neutral': int(weights[scores == 0].sum()),
+            'average_score': float(np.dot(scores, weights) / total_weight) if total_weight else 0.0,
+            'scores': scores,
+        }
+        result['positive_ratio'] = result['positive'] / n_docs
+        result['negative_ratio'] = result['negative'] / n_docs
+        result['neutral_ratio'] = result['neutral'] / n_docs
+        self.results['sentiment'] = result
+
+        print("\n=== 情感分析结果 ===")
+        print(f"积极对话: {result['positive']} 条（积极度 {result['positive_ratio']:.2%}）")
+        print(f"消极对话: {result['negative']} 条（消极度 {result['negative_ratio']:.2%}）")
+        print(f"中性对话: {result['neutral']} 条（中性度 {result['neutral_ratio']:.2%}）")
+        print(f"平均情感得分: {result['average_score']:.4f}")
+        # 只有得分确实为正（负）时才有“最积极（消极）”的对话，全部中性时都不输出
+        if matrix.n_docs and scores.max() > 0:
+            print(f"最积极的对话: {self.dialogues[int(np.argmax(scores))]}")
+        if matrix.n_docs and scores.min() < 0:
+            print(f"最消极的对话: {self.dialogues[int(np.argmin(scores))]}")
+        return result
+
+    def extract_keywords(self, top_k=20):
+        """
+        用TF-IDF提取关键词：每个词在各条对话中的 tf * idf 之和
+
+        tf 为词在该对话中的次数除以对话词数，idf = ln(N / (1 + df)) + 1；
+        去重后 N、df 和 tf 之和都按每条对话的出现次数加权，与不去重时的结果一致
+
+        参数:
+        top_k: 返回的关键词数量
+
+        返回:
+        list: (词语, 得分) 列表，按得分从高到低排列
+        """
+        matrix = self.matrix
+        if not matrix.vocabulary:
+            self.results['keywords'] = []
+            return []
+
+        weights = self.dialogue_weights
+        n_docs = matrix.n_docs if weights is None else int(weights.sum())
+        idf = np.log(n_docs / (1.0 + matrix.document_frequencies(weights))) + 1.0
+        doc_lengths = np.maximum(matrix.doc_lengths, 1)
+        tf = matrix.data / doc_lengths[matrix.rows]
+        if weights is not None:
+            tf = tf * weights[matrix.rows]
+        scores = np.bincount(matrix.indices, weights=tf * idf[matrix.indices],
+                             minlength=len(matrix.vocabulary))
+
+        # 关键词只考虑两个字及以上的内容词
+        mask = self._content_mask()
+        mask &= np.array([len(word) > 1 for word in matrix.vocabulary], dtype=bool)
+        scores = np.where(mask, scores, 0.0)
+
+        top = np.argsort(-scores, kind='stable')[:top_k]
+        keywords = [(matrix.vocabulary[i], float(scores[i])) for i in top if scores[i] > 0]
+        self.results['keywords'] = keywords
+
+        print("\n=== 关键词提取结果（TF-IDF方法）===")
+        for rank, (word, score) in enumerate(keywords, 1):
+            print(f"{rank:2d}. {word}: {score:.4f}")
+        return keywords
+
+    def word_frequencies(self, words=None):
+        """
+        统计内容词的词频
+
+        参数:
+        words: 只统计该集合中的词（如积极词典），为None时统计全部内容词
+
+        返回:
+        dict: 词语到频次的映射
+        """
+        matrix = self.matrix
+        mask = self._content_mask()
+        if words is not None:
+            mask &= matrix.term_mask(words)
+        totals = matrix.term_totals(self.dialogue_weights)
+        return {matrix.vocabulary[i]: float(totals[i]) for i in np.flatnonzero(mask & (totals > 0))}
+
+    def sentiment_frequencies(self, label):
+        """
+        统计情感词典命中的频次（包括跨越多个词的短语）
+
+        参数:
+        label: 'positive' 或 'negative'
+
+        返回:
+        dict: 情感词到命中次数的映射
+        """
+        self.build_matrix()  # 情感词在构建矩阵时一并匹配
+        return {word: float(count) for word, count in self._sentiment_hits[label].items()
+                if word not in self.stopwords}
+
+    def generate_word_clouds(self, metrics=None):
+        """
+        生成总体、积极和消极三张词云，保存到 output_dir
+
+        参数:
+        metrics: PipelineMetrics 实例，提供时记录每张词云的统计、布局和编码耗时
+
+        返回:
+        dict: 词云名称到图片路径的映射
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        with measure(metrics, 'frequencies'):
+            clouds = {
+                'wordcloud.png': self.word_frequencies(),
+                'positive_wordcloud.png': self.sentiment_frequencies('positive'),
+                'negative_wordcloud.png': self.sentiment_frequencies('negative'),
+            }
+
+        print("\n=== 生成词云 ===")
+        paths = {}
+        for filename, frequencies in clouds.items():
+            if not frequencies:
+                print(f"没有可用于 {filename} 的词语，跳过")
+                continue
+            path = os.path.join(self.output_dir, filename)
+            generate_word_cloud_from_frequencies(frequencies, path, metrics=metrics)
+            paths[filename] = path
+        self.results['word_clouds'] = paths
+        return paths
+
+    def save_results(self, path=None):
+        """
+        把情感分析汇总、关键词和词云路径写入JSON（不含每条对话的得分）
+
+        参数:
+        path: 输出路径，默认为 output_dir 下的 results.json
+
+        返回:
+        str: 写入的路径
+        """
+        path = path or os.path.join(self.output_dir, RESULTS_FILE)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        summary = {
+            'source_file': self.source_file,
+            'n_dialogues': int(self.dialogue_weights.sum()) if self.dialogue_weights is not None else len(self.dialogues),
+            'n_unique_dialogues': len(self.dialogues),
+        }
+        if 'sentiment' in self.results:
+            summary['sentiment'] = {key: value for key, value in self.results['sentiment'].items() if key != 'scores'}
+        if 'keywords' in self.results:
+            summary['keywords'] = self.results['keywords']
+        if 'word_clouds' in self.results:
+            summary['word_clouds'] = self.results['word_clouds']
+
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def run_complete_analysis(self, file_path=None):
+        """
+        执行完整分析：情感分析、关键词提取和词云生成
+
+        参数:
+        file_path: 对话文件路径；与已加载的文件不同时重新加载
+
+        返回:
+        dict: 各项分析结果
+        """
+        if file_path and (file_path != self.source_file or not self.dialogues):
+            if not self.load_dialogues_from_file(file_path):
+                return self.results
+        if not self.dialogues:
+            print("没有可分析的对话，请先加载对话文件")
+            return self.results
+
+        self.analyze_sentiment()
+        self.extract_keywords()
+        self.generate_word_clouds()
+        self.save_results()
+        return self.results
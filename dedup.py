@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话去重
+功能：在提取和分析之间合并重复的对话。完全相同的对话（只忽略首尾空白和连续空白，区分大小写）
+      直接用字典合并；其余对话计算字符片段的MinHash签名，用LSH分桶找出相似度超过阈值的候选，
+      近似重复的对话并入最先出现的那一条。每条保留的对话都记录出现次数，
+      之后分词和情感匹配只对每条唯一对话做一次，统计时再按次数加权
+
+用法:
+python dedup.py caleb_dialogues.txt -o caleb_dialogues.dedup.tsv --threshold 0.8
+"""
+
+import argparse
+import re
+import zlib
+from array import array
+
+import numpy as np
+
+# 默认的近似重复阈值（字符片段集合的Jaccard相似度）
+DEFAULT_THRESHOLD = 0.8
+
+# MinHash签名长度
+DEFAULT_NUM_PERM = 64
+
+# 字符片段长度，中文以两个字为宜
+DEFAULT_SHINGLE_SIZE = 2
+
+# 哈希 (a * x + b) mod p 使用的梅森素数，a、b、x 都小于 p，乘积不会溢出uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """精确去重使用的规范形式：去掉首尾空白并合并连续空白，不改变大小写（OK 与 ok 是不同的对话）"""
+    return _WHITESPACE_RE.sub(' ', text.strip())
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    选择LSH的分段方式：签名分为 bands 段、每段 rows 个值，
+    使两条对话成为候选的相似度拐点 (1 / bands) ** (1 / rows) 最接近 threshold
+
+    返回:
+    (bands, rows) 元组
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+class MinHasher:
+    """
+    计算文本字符片段集合的MinHash签名
+
+    参数:
+    num_perm: 签名长度
+    shingle_size: 字符片段长度，短于该长度的文本以整段文本作为唯一片段
+    seed: 生成哈希函数参数的随机种子，相同种子得到相同签名
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = generator.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+
+    def shingles(self, text):
+        size = self.shingle_size
+        if len(text) <= size:
+            return {text}
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def signature(self, text):
+        """返回长度为 num_perm 的uint32签名"""
+        # crc32 在不同进程、不同次运行之间保持一致（内置hash会随机加盐）
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in self.shingles(text)),
+                             dtype=np.uint64)
+        hashes %= _MERSENNE_PRIME
+        return ((self._a * hashes + self._b) % _MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+
+class Deduplicator:
+    """
+    逐条合并重复对话，保留每组中最先出现的一条及该组的出现次数
+
+    参数:
+    threshold: 近似重复阈值，估计的Jaccard相似度不低于该值时视为重复
+    near: 为False时只合并完全相同的对话
+    num_perm / shingle_size: MinHash签名长度和字符片段长度
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, near=True, num_perm=DEFAULT_NUM_PERM,
+                 shingle_size=DEFAULT_SHINGLE_SIZE):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"相似度阈值必须在 (0, 1] 之间: {threshold}")
+        self.threshold = threshold
+        self.near = near
+        self.texts = []
+        self.counts = array('l')
+        self.n_seen = 0
+        self.n_exact = 0
+        self.n_near = 0
+        self._exact = {}
+        if near:
+            self._hasher = MinHasher(num_perm, shingle_size)
+            self._bands, self._rows = lsh_bands(threshold, num_perm)
+            self._buckets = [{} for _ in range(self._bands)]
+            self._signatures = []
+
+    def _band_keys(self, signature):
+        rows = self._rows
+        return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self._bands)]
+
+    def _find_near(self, signature, band_keys):
+        """在与 signature 至少有一段相同的已保留对话中找出相似度最高且达到阈值的一条"""
+        candidates = set()
+        for buckets, key in zip(self._buckets, band_keys):
+            candidates.update(buckets.get(key, ()))
+        best, best_similarity = None, 0.0
+        # 按序号遍历，相似度相同时取最先出现的一条，结果与集合的遍历顺序无关
+        for index in sorted(candidates):
+            similarity = np.count_nonzero(self._signatures[index] == signature) / len(signature)
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = index, similarity
+        return best
+
+    def add(self, text):
+        """
+        加入一条对话
+
+        返回:
+        int: 该对话所属组（保留的对话）的序号
+        """
+        self.n_seen += 1
+        key = normalize(text)
+        index = self._exact.get(key)
+        if index is not None:
+            self.n_exact += 1
+            self.counts[index] += 1
+            return index
+
+        if self.near:
+            signature = self._hasher.signature(key)
+            band_keys = self._band_keys(signature)
+            index = self._find_near(signature, band_keys)
+            if index is not None:
+                self.n_near += 1
+                self.counts[index] += 1
+                # 之后出现的相同文本直接走精确匹配
+                self._exact[key] = index
+                return index
+
+        index = len(self.texts)
+        self.texts.append(text.strip())
+        self.counts.append(1)
+        self._exact[key] = index
+        if self.near:
+            self._signatures.append(signature)
+            for buckets, band_key in zip(self._buckets, band_keys):
+                buckets.setdefault(band_key, []).append(index)
+        return index
+
+    def update(self, texts):
+        for text in texts:
+            self.add(text)
+        return self
+
+    def __len__(self):
+        return len(self.texts)
+
+    def items(self):
+        """按首次出现的顺序产出 (对话, 出现次数)"""
+        return zip(self.texts, self.counts)
+
+
+def dedupe(texts, threshold=DEFAULT_THRESHOLD, near=True):
+    """
+    合并重复的对话
+
+    参数:
+    texts: 对话（可迭代对象，只遍历一次）
+    threshold: 近似重复阈值
+    near: 为False时只合并完全相同的对话
+
+    返回:
+    Deduplicator: texts 为保留的对话，counts 为对应的出现次数
+    """
+    return Deduplicator(threshold, near).update(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并重复和近似重复的对话，输出每条唯一对话及其出现次数")
+    parser.add_argument('input_file', help="对话文件（每行一条）")
+    parser.add_argument('-o', '--output', help="输出文件，每行为“次数<TAB>对话”（默认不输出）")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"近似重复阈值（默认{DEFAULT_THRESHOLD}）")
+    parser.add_argument('--exact-only', action='store_true', help="只合并完全相同的对话")
+    args = parser.parse_args()
+
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        deduplicator = dedupe((line.strip() for line in f if line.strip()), args.threshold, not args.exact_only)
+
+    print(f"共 {deduplicator.n_seen} 条对话，保留 {len(deduplicator)} 条"
+          f"（完全重复 {deduplicator.n_exact} 条，近似重复 {deduplicator.n_near} 条）")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for text, count in deduplicator.items():
+                f.write(f"{count}\t{text}\n")
+        print(f"去重结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流式对话提取模块
+功能：逐行读取对话文件，用一个预编译的正则一次性提取任意多个角色的对话，
+      并边读边写入各角色对应的输出文件，内存占用与语料大小无关
+作者：runyoung
+版本：1.0
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+
+# 默认提取的角色
+DEFAULT_SPEAKERS = ('Caleb',)
+
+# 非对话内容（表情包、图片等）的标记
+NON_DIALOGUE_MARKERS = ('jpg', 'png', '图片')
+
+# 增量提取清单的格式版本，格式变化时旧清单自动失效
+MANIFEST_VERSION = 1
+
+_NON_DIALOGUE_RE = re.compile('|'.join(re.escape(x) for x in NON_DIALOGUE_MARKERS), re.IGNORECASE)
+
+# 任意角色的对话行（如“Caleb: ...”“我：...”），角色名不含冒号且长度有限，避免把正文中的冒号当作分隔符
+_TURN_RE = re.compile(r'^\s*([^\s：:][^：:]{0,31}?)\s*[：:]\s*(.+)')
+
+
+def compile_speaker_pattern(speakers):
+    """
+    把多个角色名编译成一个不区分大小写的正则，同时支持中文冒号“：”和英文冒号“:”
+
+    参数:
+    speakers: 角色名列表
+
+    返回:
+    re.Pattern: 第1组为角色名，第2组为对话内容
+    """
+    # 长名字优先，避免“Cal”抢先匹配“Caleb”
+    names = sorted(set(speakers), key=len, reverse=True)
+    alternation = '|'.join(re.escape(name) for name in names)
+    return re.compile(r'^\s*(' + alternation + r')\s*[：:]\s*(.+)', re.IGNORECASE)
+
+
+def is_dialogue(text):
+    """判断提取到的内容是否为真正的对话（排除“思考.jpg”之类的表情包）"""
+    return bool(text) and not _NON_DIALOGUE_RE.search(text)
+
+
+def iter_source_files(input_folder):
+    """递归遍历文件夹，按路径顺序返回所有txt文件的路径，保证结果可复现"""
+    for root, dirs, files in os.walk(input_folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.txt'):
+                yield os.path.join(root, filename)
+
+
+def resolve_workers(workers):
+    """把命令行传入的进程数转换为实际进程数，0或None表示使用全部CPU核心"""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def iter_file_dialogues(file_path, pattern, canonical_names):
+    """
+    逐行扫描单个文件，产出匹配到的对话
+
+    参数:
+    file_path: 对话文件路径
+    pattern: compile_speaker_pattern 返回的正则
+    canonical_names: 角色名规范键（speaker_key）到规范角色名的映射
+
+    产出:
+    (speaker, dialogue) 元组
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = pattern.match(line)
+            if not match:
+                continue
+            dialogue = match.group(2).strip()
+            if is_dialogue(dialogue):
+                yield canonical_names[speaker_key(match.group(1))], dialogue
+
+
+def speaker_key(name):
+    """角色名的规范键（不区分大小写），Caleb、CALEB、caleb 为同一角色"""
+    return name.casefold()
+
+
+def iter_turns(file_path, names=None):
+    """
+    逐行扫描单个文件，产出所有角色的对话及其在对话中的位置
+
+    同一角色连续说的多行属于同一轮，轮次在换人时加一。角色名不区分大小写，
+    同一角色统一使用第一次出现时的写法
+
+    参数:
+    file_path: 对话文件路径
+    names: 规范键到角色名写法的映射，多个文件共用同一个字典时各文件的写法保持一致；为None时只在本文件内统一
+
+    产出:
+    (line_no, turn_index, speaker, prev_speaker, dialogue) 元组，line_no 从1开始，
+    prev_speaker 为上一轮的角色，第一轮为None
+    """
+    names = {} if names is None else names
+    turn_index = -1
+    speaker = prev_speaker = None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            match = _TURN_RE.match(line)
+            if not match:
+                continue
+            dialogue = match.group(2).strip()
+            if not is_dialogue(dialogue):
+                continue
+            name = names.setdefault(speaker_key(match.group(1)), match.group(1))
+            if name != speaker:
+                prev_speaker, speaker = speaker, name
+                turn_index += 1
+            yield line_no, turn_index, speaker, prev_speaker, dialogue
+
+
+def iter_folder_turns(input_folder, names=None):
+    """
+    递归遍历文件夹，按文件顺序产出所有角色的对话，读取失败的文件只给出提示并跳过
+
+    参数:
+    input_folder: 包含对话文件的文件夹路径
+    names: 同 iter_turns，为None时整个文件夹共用一份映射，同一角色只有一种写法
+
+    产出:
+    (scene, line_no, turn_index, speaker, prev_speaker, dialogue) 元组，scene 为文件的相对路径
+    """
+    names = {} if names is None else names
+    for file_path in iter_source_files(input_folder):
+        scene = os.path.relpath(file_path, input_folder)
+        try:
+            for turn in iter_turns(file_path, names):
+                yield (scene,) + turn
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"读取文件{os.path.basename(file_path)}时出错: {e}")
+
+
+# 工作进程内的正则和角色名映射，由 _init_worker 在每个进程中编译一次
+_worker_state = {}
+
+
+def _init_worker(speakers):
+    _worker_state['pattern'] = compile_speaker_pattern(speakers)
+    _worker_state['canonical_names'] = {speaker_key(name): name for name in speakers}
+
+
+def _extract_file(file_path):
+    """
+    在工作进程中提取单个文件的全部对话
+
+    返回:
+    (file_path, records, error) 元组，读取失败时 records 为空、error 为错误信息
+    """
+    try:
+        records = list(iter_file_dialogues(file_path, _worker_state['pattern'],
+                                           _worker_state['canonical_names']))
+        return file_path, records, None
+    except (OSError, UnicodeDecodeError) as e:
+        return file_path, [], str(e)
+
+
+def iter_file_results(file_paths, speakers, workers=1):
+    """
+    提取一组文件的对话，workers 大于1时把文件分片到进程池中并行处理
+
+    结果严格按 file_paths 的顺序返回，因此并行与串行的输出完全一致
+
+    参数:
+    file_paths: 对话文件路径列表
+    speakers: 需要提取的角色名列表
+    workers: 进程数，0或None表示使用全部CPU核心
+
+    产出:
+    (file_path, records, error) 元组
+    """
+    workers = resolve_workers(workers)
+    file_paths = list(file_paths)
+
+    if workers == 1 or len(file_paths) < 2:
+        _init_worker(speakers)
+        for file_path in file_paths:
+            yield _extract_file(file_path)
+        return
+
+    workers = min(workers, len(file_paths))
+    # 每个任务携带一批文件，减少进程间通信次数
+    chunksize = max(1, min(64, len(file_paths) // (workers * 4)))
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(list(speakers),)) as pool:
+        yield from pool.imap(_extract_file, file_paths, chunksize=chunksize)
+
+
+def iter_dialogues(input_folder, speakers=DEFAULT_SPEAKERS, workers=1):
+    """
+    以生成器方式递归遍历文件夹中的所有对话文件，单次扫描提取多个角色的对话
+
+    参数:
+    input_folder: 包含对话文件的文件夹路径
+    speakers: 需要提取的角色名列表
+    workers: 进程数，1为串行，0或None表示使用全部CPU核心
+
+    产出:
+    (speaker, dialogue) 元组，speaker 为 speakers 中给出的写法
+    """
+    file_paths = iter_source_files(input_folder)
+    for file_path, records, error in iter_file_results(file_paths, speakers, workers):
+        if error:
+            print(f"读取文件{os.path.basename(file_path)}时出错: {error}")
+        yield from records
+
+
+def file_digest(file_path):
+    """计算文件内容的SHA-1摘要"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path, input_folder, speakers):
+    """
+    读取增量提取清单
+
+    清单不存在、已损坏，或者与本次的输入文件夹、角色列表不一致时返回空字典
+
+    返回:
+    dict: 相对路径到文件记录的映射，记录包含 size、mtime、sha1 和 records
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if (manifest.get('version') != MANIFEST_VERSION
+            or manifest.get('input_folder') != os.path.abspath(input_folder)
+            or manifest.get('speakers') != list(speakers)):
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(manifest_path, input_folder, speakers, entries):
+    """写入增量提取清单，先写临时文件再替换，避免中途失败留下损坏的清单"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'input_folder': os.path.abspath(input_folder),
+        'speakers': list(speakers),
+        'files': entries,
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def _collect_entries(input_folder, speakers, manifest_path, workers):
+    """
+    对比清单与当前文件，只重新解析新增或内容变化的文件
+
+    无法读取的文件（如失效的符号链接、没有读权限）只给出提示，不写入清单，下次运行时重新尝试
+
+    返回:
+    (entries, stats) 元组，entries 按文件顺序排列
+    """
+    previous = load_manifest(manifest_path, input_folder, speakers)
+    entries = {}
+    stale = []
+    reused = 0
+    failed = set()
+
+    for file_path in iter_source_files(input_folder):
+        key = os.path.relpath(file_path, input_folder)
+        entry = previous.get(key)
+        try:
+            stat = os.stat(file_path)
+            # 大小和修改时间都没变，直接复用（上次解析失败、没有摘要的记录除外）
+            if (entry and entry.get('sha1') is not None
+                    and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns):
+                entries[key] = entry
+                reused += 1
+                continue
+
+            # 修改时间变了但内容没变（如被touch或重新拷贝），更新元数据后复用
+            digest = file_digest(file_path)
+        except OSError as e:
+            print(f"读取文件{os.path.basename(file_path)}时出错: {e}")
+            failed.add(key)
+            continue
+        if entry and entry.get('sha1') == digest:
+            entry.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+            entries[key] = entry
+            reused += 1
+            continue
+
+        entries[key] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': digest, 'records': []}
+        stale.append(file_path)
+
+    for file_path, records, error in iter_file_results(stale, speakers, workers):
+        key = os.path.relpath(file_path, input_folder)
+        if error:
+            print(f"读取文件{os.path.basename(file_path)}时出错: {error}")
+            # 不写入清单，下次运行时重新尝试
+            del entries[key]
+            failed.add(key)
+            continue
+        entries[key]['records'] = [list(record) for record in records]
+
+    stats = {
+        'parsed': len(stale),
+        'reused': reused,
+        'removed': len(set(previous) - set(entries) - failed),
+        'failed': len(failed),
+    }
+    return entries, stats
+
+
+def extract_dialogues(input_folder, outputs, workers=1, manifest_path=None, progress=None):
+    """
+    从对话文件中提取多个角色的对话，边提取边写入各自的输出文件
+
+    参数:
+    input_folder: 包含对话文件的文件夹路径
+    outputs: 角色名到输出文件路径的映射，如 {'Caleb': 'caleb_dialogues.txt'}
+    workers: 进程数，1为串行，0或None表示使用全部CPU核心
+    manifest_path: 增量提取清单路径，提供时只重新解析新增或变化的文件，
+                   已删除文件的对话会被移除，输出与全量提取完全一致
+    progress: ProgressReporter 实例，提供时每条对话更新一次（输出频率由它限制）
+
+    返回:
+    dict: 每个角色提取到的对话数量
+    """
+    speakers = list(outputs)
+    if manifest_path:
+        entries, stats = _collect_entries(input_folder, speakers, manifest_path, workers)
+        print(f"增量提取: 解析 {stats['parsed']} 个文件，复用 {stats['reused']} 个，"
+              f"移除 {stats['removed']} 个，读取失败 {stats['failed']} 个")
+        records = (tuple(record) for entry in entries.values() for record in entry['records'])
+    else:
+        records = iter_dialogues(input_folder, speakers, workers)
+
+    counts = {speaker: 0 for speaker in outputs}
+    sinks = {}
+    try:
+        for speaker, path in outputs.items():
+            sinks[speaker] = open(path, 'w', encoding='utf-8')
+
+        for speaker, dialogue in records:
+            sinks[speaker].write(dialogue + '\n')
+            counts[speaker] += 1
+            if progress is not None:
+                progress.update(1, len(dialogue.encode('utf-8')) + 1)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+    if manifest_path:
+        save_manifest(manifest_path, input_folder, speakers, entries)
+
+    return counts
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+列式对话存储
+功能：把对话文件夹中所有角色的对话连同场景、行号、轮次、上一轮角色和分词结果（词ID）
+      写入一个未压缩的Arrow/Feather文件。读取时以内存映射方式打开，只加载需要的列，
+      按角色、场景过滤也不必重新解析原始文本
+
+用法:
+python dialogue_store.py Caleb_data dialogues.arrow
+"""
+
+import argparse
+import os
+
+from dialogue_extractor import iter_folder_turns, speaker_key
+
+DEFAULT_STORE_PATH = 'dialogues.arrow'
+
+# 每个记录批次的最大行数，写入时的内存占用与语料大小无关
+BATCH_ROWS = 65536
+
+COLUMNS = ('speaker', 'scene', 'line_no', 'turn_index', 'prev_speaker', 'text', 'token_ids')
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('speaker', pa.string()),
+        ('scene', pa.string()),
+        ('line_no', pa.int32()),
+        ('turn_index', pa.int32()),
+        ('prev_speaker', pa.string()),
+        ('text', pa.string()),
+        ('token_ids', pa.list_(pa.uint32())),
+    ])
+
+
+def vocabulary_path(store_path):
+    """词表文件路径：与存储文件同名，扩展名为 .vocab.txt，第i行为ID为i的词"""
+    return os.path.splitext(store_path)[0] + '.vocab.txt'
+
+
+def load_vocabulary(store_path):
+    """读取存储的词表（token_corpus.Vocabulary）"""
+    from token_corpus import Vocabulary
+
+    return Vocabulary.load(vocabulary_path(store_path))
+
+
+def _iter_rows(input_folder):
+    # 整个文件夹共用一份角色名映射，同一角色在整个存储中只有一种写法
+    for scene, line_no, turn_index, speaker, prev_speaker, text in iter_folder_turns(input_folder):
+        yield speaker, scene, line_no, turn_index, prev_speaker, text
+
+
+def build_store(input_folder, store_path=DEFAULT_STORE_PATH, token_cache=None, workers=1):
+    """
+    解析对话文件夹并写入列式存储，同时写出词表
+
+    参数:
+    input_folder: 包含对话文件的文件夹路径（递归遍历）
+    store_path: 输出的Arrow文件路径
+    token_cache: TokenCache 实例，提供时复用已缓存的分词结果
+    workers: 分词进程数，1为串行，0表示使用全部CPU核心
+
+    返回:
+    int: 写入的对话行数
+    """
+    import pyarrow as pa
+
+    from token_cache import _batches, iter_line_tokens
+    from token_corpus import TokenCorpus, Vocabulary
+    from word_cloud_generator import clean_text
+
+    schema = _schema()
+    vocabulary = Vocabulary()
+    n_rows = 0
+    tmp_path = store_path + f'.{os.getpid()}.tmp'
+
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in _batches(_iter_rows(input_folder), BATCH_ROWS):
+            columns = list(zip(*batch))
+            lines = (clean_text(text).replace('\n', ' ') for text in columns[5])
+            # 每批的词ID和偏移直接组成Arrow的列表列，不经过逐行的Python列表
+            corpus = TokenCorpus.build(iter_line_tokens(lines, token_cache, workers), vocabulary)
+            arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+            arrays.append(pa.ListArray.from_arrays(pa.array(corpus.offsets.astype('int32')),
+                                                   pa.array(corpus.token_ids, type=pa.uint32())))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            n_rows += len(batch)
+
+    vocabulary.save(vocabulary_path(store_path))
+    os.replace(tmp_path, store_path)
+    return n_rows
+
+
+def open_store(store_path=DEFAULT_STORE_PATH, columns=None):
+    """
+    以内存映射方式打开列式存储，不复制数据
+
+    参数:
+    store_path: Arrow文件路径
+    columns: 需要的列，为None时返回全部列
+
+    返回:
+    pyarrow.Table
+    """
+    import pyarrow as pa
+
+    # 表中的数据直接引用映射的内存，映射随表一起释放
+    table = pa.ipc.open_file(pa.memory_map(store_path, 'r')).read_all()
+    return table.select(list(columns)) if columns else table
+
+
+def _filter_table(table, filters):
+    """按列值过滤，speaker 列不区分大小写"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for name, value in filters.items():
+        if name == 'speaker':
+            # 在不重复的角色名中找出与 value 同一角色的写法，再按这些写法过滤
+            key = speaker_key(value)
+            matches = [speaker for speaker in pc.unique(table[name]).to_pylist()
+                       if speaker is not None and speaker_key(speaker) == key]
+            table = table.filter(pc.is_in(table[name], value_set=pa.array(matches, type=pa.string())))
+        else:
+            table = table.filter(pc.equal(table[name], value))
+    return table
+
+
+def read_dialogues(store_path=DEFAULT_STORE_PATH, columns=None, speaker=None, scene=None):
+    """
+    读取对话为pandas DataFrame，只取需要的列和行
+
+    参数:
+    store_path: Arrow文件路径
+    columns: 需要的列，为None时返回全部列
+    speaker: 只保留该角色的对话（不区分大小写）
+    scene: 只保留该场景（相对路径）的对话
+
+    返回:
+    pandas.DataFrame
+    """
+    needed = list(columns or COLUMNS)
+    filters = {name: value for name, value in (('speaker', speaker), ('scene', scene)) if value is not None}
+    table = open_store(store_path, needed + [name for name in filters if name not in needed])
+
+    table = _filter_table(table, filters)
+    return table.select(needed).to_pandas()
+
+
+def load_corpus(store_path=DEFAULT_STORE_PATH, speaker=None, scene=None):
+    """
+    把存储中的 token_ids 列读取为词ID语料，词ID与偏移直接取自内存映射的Arrow数据
+
+    参数:
+    speaker: 只保留该角色的对话（不区分大小写）
+    scene: 只保留该场景（相对路径）的对话
+
+    返回:
+    TokenCorpus
+    """
+    import numpy as np
+
+    from token_corpus import TokenCorpus
+
+    filters = {name: value for name, value in (('speaker', speaker), ('scene', scene)) if value is not None}
+    table = open_store(store_path, ['token_ids'] + list(filters))
+    table = _filter_table(table, filters)
+
+    # 多个记录批次需要合并为一个列表数组（只有一个批次且未过滤时不复制）
+    token_lists = table['token_ids'].combine_chunks()
+    offsets = np.asarray(token_lists.offsets).astype(np.int64)
+    token_ids = token_lists.values.to_numpy()[offsets[0]:offsets[-1]]
+    return TokenCorpus(load_vocabulary(store_path), token_ids, offsets - offsets[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建列式对话存储")
+    parser.add_argument('input_folder', nargs='?', default='Caleb_data', help="对话文件夹（默认Caleb_data）")
+    parser.add_argument('store_path', nargs='?', default=DEFAULT_STORE_PATH,
+                        help=f"输出文件路径（默认{DEFAULT_STORE_PATH}）")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="并行分词的进程数，0表示使用全部CPU核心（默认1）")
+    args = parser.parse_args()
+
+    from jieba_dict_cache import load_jieba
+    from token_cache import TokenCache
+
+    load_jieba()
+    with TokenCache() as token_cache:
+        n_rows = build_store(args.input_folder, args.store_path, token_cache, args.workers)
+    print(f"已写入 {n_rows} 条对话到 {args.store_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+jieba词典预编译缓存
+功能：把jieba的前缀词典（包括用户词典）编译一次后保存到项目缓存目录，
+      之后每个进程通过mmap直接读取，跳过构建词典和逐行加载用户词典的开销
+
+用法:
+python jieba_dict_cache.py [用户词典 ...]    # 预先编译缓存
+"""
+
+import hashlib
+import marshal
+import mmap
+import os
+import sys
+import tempfile
+
+import jieba
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'jieba')
+
+# 当前进程已加载的词典指纹和用户词典列表
+_loaded = {'fingerprint': None, 'user_dicts': ()}
+
+
+def _main_dictionary():
+    return jieba.dt.dictionary or os.path.join(os.path.dirname(jieba.__file__), 'dict.txt')
+
+
+def dictionary_fingerprint(user_dicts=()):
+    """
+    计算词典指纹
+
+    由jieba版本号以及主词典、各用户词典的路径、大小和修改时间组成，任意一个变化指纹就会改变
+
+    参数:
+    user_dicts: 用户词典路径列表
+
+    返回:
+    str: 十六进制指纹
+    """
+    parts = [f"jieba-{jieba.__version__}"]
+    for path in (_main_dictionary(),) + tuple(user_dicts):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(path)
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _read_cache(cache_file):
+    """通过mmap读取编译好的词典，多个进程共享操作系统页缓存中的同一份文件"""
+    with open(cache_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return marshal.loads(mapped)
+
+
+def _write_cache(cache_file, data):
+    """先写临时文件再替换，避免并发进程读到写了一半的缓存"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+    with os.fdopen(fd, 'wb') as f:
+        marshal.dump(data, f)
+    os.replace(tmp_path, cache_file)
+
+
+def load_jieba(user_dicts=(), cache_dir=DEFAULT_CACHE_DIR):
+    """
+    加载jieba词典，优先使用预编译缓存
+
+    同一进程内重复调用（且词典未变化）不会重复加载；在创建进程池之前调用时，
+    fork出的工作进程直接继承已加载的词典
+
+    参数:
+    user_dicts: 用户词典路径列表
+    cache_dir: 缓存目录
+
+    返回:
+    str: 词典指纹，可作为分词缓存的版本标识
+    """
+    user_dicts = tuple(user_dicts)
+    fingerprint = dictionary_fingerprint(user_dicts)
+    if _loaded['fingerprint'] == fingerprint and jieba.dt.initialized:
+        return fingerprint
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"prefix-{fingerprint}.marshal")
+
+    try:
+        freq, total, user_word_tag_tab = _read_cache(cache_file)
+        with jieba.dt.lock:
+            jieba.dt.FREQ, jieba.dt.total = freq, total
+            jieba.dt.user_word_tag_tab = user_word_tag_tab
+            jieba.dt.initialized = True
+    except (OSError, ValueError, EOFError, TypeError):
+        # 缓存不存在或已损坏：正常构建词典并加载用户词典，然后写入缓存
+        jieba.dt.initialized = False
+        jieba.initialize()
+        for path in user_dicts:
+            jieba.load_userdict(path)
+        _write_cache(cache_file, (jieba.dt.FREQ, jieba.dt.total, jieba.dt.user_word_tag_tab))
+
+    _loaded['fingerprint'] = fingerprint
+    _loaded['user_dicts'] = user_dicts
+    return fingerprint
+
+
+def loaded_user_dicts():
+    """返回当前进程已加载的用户词典列表，用于在工作进程中以相同配置加载词典"""
+    return _loaded['user_dicts']
+
+
+def main():
+    user_dicts = sys.argv[1:]
+    fingerprint = load_jieba(user_dicts)
+    print(f"jieba词典缓存已就绪: {os.path.join(DEFAULT_CACHE_DIR, f'prefix-{fingerprint}.marshal')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量TF-IDF关键词索引
+功能：把每个场景文件中每个角色的对话作为一篇文档，在SQLite中保存各文档的词频和全局文档频率。
+      新增或修改的对话文件只需重新分词这些文件，任意子集（某个角色、某个场景、某段日期）
+      的前K个关键词直接由索引查询得到，不再重新扫描整个语料
+
+用法:
+python keyword_index.py update Caleb_data --speakers Caleb
+python keyword_index.py top -k 20 --speaker Caleb --scene The_cinema_is_closed.txt
+"""
+
+import argparse
+import heapq
+import math
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict
+
+from dialogue_extractor import DEFAULT_SPEAKERS, file_digest, iter_file_results, iter_source_files, speaker_key
+
+DEFAULT_INDEX_PATH = os.path.join('.cache', 'keywords.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    speaker TEXT,
+    scene TEXT,
+    date TEXT,
+    n_tokens INTEGER NOT NULL,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_speaker ON documents (speaker);
+CREATE INDEX IF NOT EXISTS documents_scene ON documents (scene);
+CREATE INDEX IF NOT EXISTS documents_date ON documents (date);
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE,
+    df INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sources (
+    scene TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    doc_id INTEGER NOT NULL,
+    term_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, term_id)
+) WITHOUT ROWID;
+"""
+
+
+class KeywordIndex:
+    """
+    基于SQLite的增量关键词索引
+
+    idf 与 CharacterDialogueAnalyzer.extract_keywords 一致：ln(N / (1 + df)) + 1，
+    N 和 df 按索引中的全部文档计算，查询子集时只改变参与求和的文档
+
+    参数:
+    path: 索引文件路径
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def commit(self):
+        self._conn.commit()
+
+    def documents(self, scene=None):
+        """返回 {文档名: 摘要}，可按场景过滤"""
+        if scene is None:
+            rows = self._conn.execute('SELECT name, digest FROM documents')
+        else:
+            rows = self._conn.execute('SELECT name, digest FROM documents WHERE scene = ?', (scene,))
+        return dict(rows)
+
+    def scenes(self):
+        """返回 {场景: 该场景文档的摘要集合}"""
+        scenes = defaultdict(set)
+        for scene, digest in self._conn.execute('SELECT scene, digest FROM documents'):
+            scenes[scene].add(digest)
+        return scenes
+
+    def speakers(self, name=None):
+        """返回索引中的角色名写法，提供 name 时只返回与它为同一角色（不区分大小写）的写法"""
+        names = [row[0] for row in self._conn.execute(
+            'SELECT DISTINCT speaker FROM documents WHERE speaker IS NOT NULL')]
+        if name is None:
+            return names
+        key = speaker_key(name)
+        return [speaker for speaker in names if speaker_key(speaker) == key]
+
+    def sources(self):
+        """返回 {场景: (大小, 修改时间, 摘要)}，记录上次读取各对话文件时的状态"""
+        return {scene: tuple(rest) for scene, *rest in
+                self._conn.execute('SELECT scene, size, mtime, digest FROM sources')}
+
+    def set_source(self, scene, size, mtime, digest):
+        self._conn.execute('INSERT OR REPLACE INTO sources (scene, size, mtime, digest) VALUES (?, ?, ?, ?)',
+                           (scene, size, mtime, digest))
+
+    def remove_scene(self, scene):
+        """移除一个场景文件的全部文档及其文件状态"""
+        for name in self.documents(scene):
+            self.remove_document(name)
+        self._conn.execute('DELETE FROM sources WHERE scene = ?', (scene,))
+
+    def add_document(self, name, tokens, speaker=None, scene=None, date=None, digest=None):
+        """
+        添加一篇文档，同名文档已存在时先移除再添加
+
+        参数:
+        name: 文档名，如 "The_cinema_is_closed.txt#Caleb"
+        tokens: 文档的全部词语
+        speaker / scene / date: 用于查询过滤的元数据，date 为 YYYY-MM-DD 字符串
+        digest: 来源内容的摘要，用于判断是否需要重建
+        """
+        self.remove_document(name)
+        counts = Counter(tokens)
+        cursor = self._conn.execute(
+            'INSERT INTO documents (name, speaker, scene, date, n_tokens, digest) VALUES (?, ?, ?, ?, ?, ?)',
+            (name, speaker, scene, date, sum(counts.values()), digest))
+        doc_id = cursor.lastrowid
+
+        self._conn.executemany('INSERT OR IGNORE INTO terms (term) VALUES (?)', ((term,) for term in counts))
+        self._conn.executemany('UPDATE terms SET df = df + 1 WHERE term = ?', ((term,) for term in counts))
+        self._conn.executemany(
+            'INSERT INTO postings (doc_id, term_id, count) SELECT ?, term_id, ? FROM terms WHERE term = ?',
+            ((doc_id, count, term) for term, count in counts.items()))
+
+    def remove_document(self, name):
+        """移除一篇文档并更新文档频率，文档不存在时什么也不做"""
+        row = self._conn.execute('SELECT doc_id FROM documents WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return
+        doc_id = row[0]
+        self._conn.execute('UPDATE terms SET df = df - 1 WHERE term_id IN '
+                           '(SELECT term_id FROM postings WHERE doc_id = ?)', (doc_id,))
+        self._conn.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+        self._conn.execute('DELETE FROM documents WHERE doc_id = ?', (doc_id,))
+
+    def _filter(self, speaker=None, scene=None, date_from=None, date_to=None):
+        conditions, params = [], []
+        if speaker is not None:
+            # 角色名不区分大小写：先找出索引中与 speaker 同一角色的写法，再按这些写法过滤
+            names = self.speakers(speaker)
+            conditions.append(f"d.speaker IN ({','.join('?' * len(names))})" if names else '0')
+            params.extend(names)
+        for clause, value in (('d.scene = ?', scene),
+                              ('d.date >= ?', date_from), ('d.date <= ?', date_to)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = ' AND '.join(conditions) if conditions else '1'
+        return where, params
+
+    def top_keywords(self, k=20, speaker=None, scene=None, date_from=None, date_to=None,
+                     stopwords=(), min_length=2):
+        """
+        查询子集中TF-IDF得分最高的关键词：各篇文档的 tf * idf 之和
+
+        参数:
+        k: 返回的关键词数量
+        speaker / scene: 只统计该角色（不区分大小写）/ 场景的文档
+        date_from / date_to: 只统计日期在该范围内（含两端）的文档
+        stopwords: 不参与排名的词
+        min_length: 关键词的最小长度
+
+        返回:
+        list: (词语, 得分) 列表，按得分从高到低排列
+        """
+        n_docs = self._conn.execute('SELECT COUNT(*) FROM documents WHERE n_tokens > 0').fetchone()[0]
+        where, params = self._filter(speaker, scene, date_from, date_to)
+        rows = self._conn.execute(
+            'SELECT t.term, t.df, SUM(CAST(p.count AS REAL) / d.n_tokens) '
+            'FROM documents d JOIN postings p ON p.doc_id = d.doc_id JOIN terms t ON t.term_id = p.term_id '
+            f'WHERE {where} GROUP BY p.term_id', params)
+
+        stopwords = set(stopwords)
+        scores = ((term, tf * (math.log(n_docs / (1.0 + df)) + 1.0)) for term, df, tf in rows
+                  if len(term) >= min_length and not term.isdigit() and term not in stopwords)
+        return [(term, score) for term, score in heapq.nlargest(k, scores, key=lambda item: item[1])
+                if score > 0]
+
+
+def _tokenize(dialogues, token_cache=None):
+    from token_cache import iter_line_tokens
+    from word_cloud_generator import clean_text
+
+    lines = (clean_text(dialogue).replace('\n', ' ') for dialogue in dialogues)
+    for tokens in iter_line_tokens(lines, token_cache):
+        yield from tokens
+
+
+def update_index(index, input_folder, speakers=DEFAULT_SPEAKERS, token_cache=None, workers=1):
+    """
+    按对话文件夹增量更新索引：只为内容变化或尚未建立索引的角色重新分词，移除已删除文件的文档
+
+    每个文件中每个角色的对话为一篇文档，名称为 "相对路径#角色"，日期取文件的修改日期。
+    与增量提取清单相同，文件的大小和修改时间都没变时不读取文件，变化时才重新计算摘要；
+    只替换 speakers 中角色的文档，其他角色已有的文档保持不变
+
+    返回:
+    dict: 本次解析、复用、移除和读取失败的文件数量
+    """
+    # 角色名不区分大小写，沿用索引中已有的写法，同一角色不会因大小写不同建立两份文档
+    existing = {speaker_key(name): name for name in index.speakers()}
+    canonical = {}
+    for speaker in speakers:
+        canonical.setdefault(speaker_key(speaker), existing.get(speaker_key(speaker), speaker))
+    speakers = list(canonical.values())
+    sources = index.sources()
+    stale = {}
+    reused = 0
+    failed = 0
+    current = set()
+
+    for file_path in iter_source_files(input_folder):
+        scene = os.path.relpath(file_path, input_folder)
+        current.add(scene)
+        source = sources.get(scene)
+        try:
+            stat = os.stat(file_path)
+            if source and source[:2] == (stat.st_size, stat.st_mtime_ns):
+                digest = source[2]
+            else:
+                digest = file_digest(file_path)
+                index.set_source(scene, stat.st_size, stat.st_mtime_ns, digest)
+        except OSError as e:
+            # 与解析失败相同：移除这些角色的文档，下次运行时重新尝试
+            print(f"读取文件{os.path.basename(file_path)}时出错: {e}")
+            for speaker in speakers:
+                index.remove_document(f"{scene}#{speaker}")
+            failed += 1
+            continue
+
+        # 只重新解析摘要不一致或还没有文档的角色
+        documents = index.documents(scene)
+        missing = [speaker for speaker in speakers if documents.get(f"{scene}#{speaker}") != digest]
+        if not missing:
+            reused += 1
+            continue
+        stale[file_path] = (digest, missing)
+
+    parse_speakers = list(dict.fromkeys(speaker for _, missing in stale.values() for speaker in missing))
+    for file_path, records, error in iter_file_results(list(stale), parse_speakers, workers):
+        scene = os.path.relpath(file_path, input_folder)
+        digest, missing = stale[file_path]
+        if error:
+            print(f"读取文件{os.path.basename(file_path)}时出错: {error}")
+            for speaker in missing:
+                index.remove_document(f"{scene}#{speaker}")
+            failed += 1
+            continue
+
+        by_speaker = defaultdict(list)
+        for speaker, dialogue in records:
+            by_speaker[speaker].append(dialogue)
+        date = time.strftime('%Y-%m-%d', time.localtime(os.path.getmtime(file_path)))
+        # 没有对话的角色也记录一篇空文档，文件未变化时可以直接跳过
+        for speaker in missing:
+            tokens = list(_tokenize(by_speaker[speaker], token_cache))
+            index.add_document(f"{scene}#{speaker}", tokens, speaker, scene, date, digest)
+
+    removed = (set(sources) | set(index.scenes())) - current
+    for scene in removed:
+        index.remove_scene(scene)
+    index.commit()
+
+    return {'parsed': len(stale), 'reused': reused, 'removed': len(removed), 'failed': failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量TF-IDF关键词索引")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help=f"索引文件路径（默认{DEFAULT_INDEX_PATH}）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update = subparsers.add_parser('update', help="按对话文件夹增量更新索引")
+    update.add_argument('input_folder', nargs='?', default='Caleb_data', help="对话文件夹（默认Caleb_data）")
+    update.add_argument('--speakers', nargs='+', default=list(DEFAULT_SPEAKERS), help="建立索引的角色")
+    update.add_argument('-j', '--workers', type=int, default=1,
+                        help="并行提取对话的进程数，0表示使用全部CPU核心（默认1）")
+
+    top = subparsers.add_parser('top', help="查询前K个关键词")
+    top.add_argument('-k', type=int, default=20, help="关键词数量（默认20）")
+    top.add_argument('--speaker', help="只统计该角色")
+    top.add_argument('--scene', help="只统计该场景文件（相对路径）")
+    top.add_argument('--from', dest='date_from', help="起始日期 YYYY-MM-DD")
+    top.add_argument('--to', dest='date_to', help="结束日期 YYYY-MM-DD")
+    args = parser.parse_args()
+
+    with KeywordIndex(args.index) as index:
+        if args.command == 'update':
+            from jieba_dict_cache import load_jieba
+            from token_cache import TokenCache
+
+            load_jieba()
+            with TokenCache() as token_cache:
+                stats = update_index(index, args.input_folder, args.speakers, token_cache, args.workers)
+            print(f"索引已更新: 解析 {stats['parsed']} 个文件，复用 {stats['reused']} 个，"
+                  f"移除 {stats['removed']} 个，读取失败 {stats['failed']} 个")
+        else:
+            from character_dialogue_analyzer import DEFAULT_STOPWORDS, load_word_list
+
+            started = time.perf_counter()
+            keywords = index.top_keywords(args.k, args.speaker, args.scene, args.date_from, args.date_to,
+                                          stopwords=load_word_list('stopwords.txt', DEFAULT_STOPWORDS))
+            elapsed = (time.perf_counter() - started) * 1000
+            for rank, (word, score) in enumerate(keywords, 1):
+                print(f"{rank:2d}. {word}: {score:.4f}")
+            print(f"查询耗时 {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+词典多模式匹配
+功能：把情感词典、停用词等词表编译成Aho-Corasick自动机，每行文本只需线性扫描一遍即可
+      找出所有词典命中，扫描速度与词典大小无关。编译结果按词表内容的哈希缓存到磁盘
+"""
+
+import hashlib
+import os
+import pickle
+from collections import deque
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'lexicons')
+
+# 缓存格式版本，自动机结构变化时旧缓存自动失效
+CACHE_VERSION = 1
+
+
+class LexiconMatcher:
+    """
+    Aho-Corasick多模式匹配器
+
+    参数:
+    lexicons: 标签到词表的映射，如 {'positive': [...], 'negative': [...]}；
+              同一个词出现在多个词表中时以先出现的标签为准
+    ignore_case: 是否忽略英文大小写
+    """
+
+    def __init__(self, lexicons, ignore_case=False):
+        self.ignore_case = ignore_case
+        # goto[state] 为字符到下一状态的映射，fail[state] 为失配时跳转的状态，
+        # outputs[state] 为在该状态结束的全部 (词长, 词, 标签)，已沿失配链合并
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+
+        for label, words in lexicons.items():
+            for word in words:
+                self._add(word, label)
+        self._build()
+
+    def _add(self, word, label):
+        if self.ignore_case:
+            word = word.lower()
+        if not word:
+            return
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        if not self.outputs[state]:
+            self.outputs[state] = ((len(word), word, label),)
+
+    def _build(self):
+        """按广度优先计算失配指针，并把失配链上的输出合并到每个状态"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def iter_matches(self, text):
+        """
+        扫描一遍文本，产出所有命中（可能相互重叠）
+
+        产出:
+        (start, end, word, label) 元组，text[start:end] 即命中的词
+        """
+        if self.ignore_case:
+            text = text.lower()
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, word, label in outputs[state]:
+                yield position + 1 - length, position + 1, word, label
+
+    def find_longest(self, text, boundaries=None):
+        """
+        最左最长匹配：命中相互重叠时保留起点最靠前、其次最长的一个，如“不开心”优先于“开心”
+
+        参数:
+        text: 待匹配文本
+        boundaries: 允许的词边界位置集合（如分词结果的切分点），提供时只保留
+                    起止位置都落在边界上的命中，避免单字词命中其他词的一部分
+
+        返回:
+        list: (start, end, word, label) 元组列表，互不重叠，按位置排列
+        """
+        matches = self.iter_matches(text)
+        if boundaries is not None:
+            matches = (m for m in matches if m[0] in boundaries and m[1] in boundaries)
+
+        selected = []
+        last_end = 0
+        for match in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+            if match[0] >= last_end:
+                selected.append(match)
+                last_end = match[1]
+        return selected
+
+    def contains_any(self, text):
+        """文本中是否包含任意一个词（找到第一个命中即返回）"""
+        return next(self.iter_matches(text), None) is not None
+
+
+def _lexicon_digest(lexicons, ignore_case):
+    digest = hashlib.sha1(f"v{CACHE_VERSION}:{ignore_case}".encode('utf-8'))
+    for label, words in lexicons.items():
+        digest.update(b'\0label\0' + label.encode('utf-8'))
+        for word in sorted(set(words)):
+            digest.update(b'\0' + word.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_matcher(lexicons, ignore_case=False, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    获取编译好的匹配器，词表内容不变时直接从磁盘缓存读取
+
+    参数:
+    lexicons: 标签到词表的映射
+    ignore_case: 是否忽略英文大小写
+    cache_dir: 缓存目录，为None时不使用磁盘缓存
+
+    返回:
+    LexiconMatcher
+    """
+    if cache_dir is None:
+        return LexiconMatcher(lexicons, ignore_case)
+
+    cache_file = os.path.join(cache_dir, _lexicon_digest(lexicons, ignore_case) + '.pickle')
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    matcher = LexiconMatcher(lexicons, ignore_case)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_file + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_file)
+    return matcher
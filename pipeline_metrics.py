@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流水线性能指标
+功能：为分析流程的每个阶段（提取、分词、情感分析、渲染等）记录墙钟时间、CPU时间、
+      处理条数、处理字节数和内存高水位，汇总为结构化结果；可选地用cProfile记录整个流程，
+      并提供限速的进度输出，代替逐行打印
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存，平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """当前进程的常驻内存（仅Linux），不支持时返回None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _cpu_seconds():
+    """本进程及已结束子进程（如进程池中的工作进程）的CPU时间之和"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageRecord:
+    """一个阶段的计量结果，阶段内通过 add 累加处理的条数和字节数"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_start = None
+        self.rss_end = None
+        self.peak_rss = None
+
+    def add(self, items=0, n_bytes=0):
+        self.items += items
+        self.bytes += n_bytes
+
+    def to_dict(self):
+        result = {
+            'items': self.items,
+            'bytes': self.bytes,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'rss_start_bytes': self.rss_start,
+            'rss_end_bytes': self.rss_end,
+            'peak_rss_bytes': self.peak_rss,
+        }
+        if self.wall_seconds:
+            result['items_per_s'] = round(self.items / self.wall_seconds, 3)
+            result['mb_per_s'] = round(self.bytes / 1024 ** 2 / self.wall_seconds, 3)
+        return result
+
+
+class _NullRecord(StageRecord):
+    """未开启计量时使用的记录，丢弃所有数据"""
+
+    def add(self, items=0, n_bytes=0):
+        pass
+
+
+class PipelineMetrics:
+    """
+    按阶段收集性能指标
+
+    阶段可以嵌套，嵌套阶段的名称为 "外层/内层"。峰值内存为阶段结束时进程的
+    历史最高常驻内存，因此某阶段的值比上一阶段高出的部分即该阶段造成的新高
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        计量一个阶段
+
+        用法:
+        with metrics.stage('extract') as record:
+            ...
+            record.add(items=1, n_bytes=len(line))
+        """
+        self._stack.append(name)
+        record = StageRecord('/'.join(self._stack))
+        # 先占位，汇总时按阶段开始的先后排列（外层阶段排在内层之前）
+        self.records.setdefault(record.name, None)
+        record.rss_start = current_rss_bytes()
+        wall_started = time.perf_counter()
+        cpu_started = _cpu_seconds()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_started
+            record.cpu_seconds = _cpu_seconds() - cpu_started
+            record.rss_end = current_rss_bytes()
+            record.peak_rss = peak_rss_bytes()
+            self._stack.pop()
+            # 同名阶段多次执行时累加
+            previous = self.records.get(record.name)
+            if previous is not None:
+                record.items += previous.items
+                record.bytes += previous.bytes
+                record.wall_seconds += previous.wall_seconds
+                record.cpu_seconds += previous.cpu_seconds
+                record.rss_start = previous.rss_start
+            self.records[record.name] = record
+
+    def summary(self):
+        """返回 {阶段名: 指标} 的字典，按阶段开始的先后排列"""
+        return {name: record.to_dict() for name, record in self.records.items() if record is not None}
+
+    def print_summary(self, file=None):
+        """以表格形式打印各阶段指标"""
+        file = file or sys.stdout
+        print("\n=== 各阶段耗时 ===", file=file)
+        print(f"{'阶段':<36}{'墙钟(s)':>10}{'CPU(s)':>10}{'条数':>10}{'MB':>10}{'峰值内存(MB)':>14}", file=file)
+        for name, record in self.records.items():
+            if record is None:
+                continue
+            peak = f"{record.peak_rss / 1024 ** 2:.1f}" if record.peak_rss is not None else '-'
+            print(f"{name:<36}{record.wall_seconds:>10.3f}{record.cpu_seconds:>10.3f}"
+                  f"{record.items:>10}{record.bytes / 1024 ** 2:>10.2f}{peak:>14}", file=file)
+
+    def save_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+@contextmanager
+def measure(metrics, name):
+    """metrics 为None时什么也不记录，调用方不必分别处理开启和关闭两种情况"""
+    if metrics is None:
+        yield _NullRecord(name)
+    else:
+        with metrics.stage(name) as record:
+            yield record
+
+
+@contextmanager
+def profiled(path):
+    """
+    用cProfile记录代码块，结束时把统计结果写入 path（可用pstats或snakeviz查看）；
+    path 为None时不做任何事
+    """
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"性能剖析结果已保存到: {path}（python -m pstats {path}）")
+
+
+class ProgressReporter:
+    """
+    限速的进度输出：无论 update 调用多频繁，最多每 interval 秒输出一行
+
+    参数:
+    label: 输出前缀
+    total: 总条数，已知时同时显示百分比
+    interval: 两次输出之间的最短间隔（秒）
+    file: 输出目标，默认标准错误
+    """
+
+    def __init__(self, label, total=None, interval=1.0, file=None):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.file = file or sys.stderr
+        self.count = 0
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._next_report = self._started + interval
+
+    def update(self, items=1, n_bytes=0):
+        self.count += items
+        self.bytes += n_bytes
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self._report(now)
+
+    def _report(self, now, final=False):
+        elapsed = max(now - self._started, 1e-9)
+        message = f"{self.label}: {self.count}"
+        if self.total:
+            message += f"/{self.total}（{self.count / self.total:.0%}）"
+        message += f"，{self.count / elapsed:.0f} 条/秒"
+        if self.bytes:
+            message += f"，{self.bytes / 1024 ** 2 / elapsed:.1f} MB/秒"
+        if final:
+            message += f"，用时 {elapsed:.1f} 秒"
+        print(message, file=self.file, flush=True)
+
+    def close(self):
+        """输出最终进度（运行时间超过一个间隔时）"""
+        now = time.monotonic()
+        if now - self._started >= self.interval:
+            self._report(now, final=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
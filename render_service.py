@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+词云渲染服务
+功能：常驻的本地HTTP服务，工作进程启动时预先加载jieba词典和渲染库，
+      之后每个请求只需分词和布局，不再为进程启动付出代价
+
+用法:
+python render_service.py --port 8765 --workers 4 --queue-size 32 --mask-dir masks
+python render_service.py --socket /tmp/wordcloud.sock
+
+接口:
+POST /render  请求体为JSON，{"text": "..."} 或 {"frequencies": {"词语": 正数频次}}，
+              可选 "format"（png/svg，默认png）、"mask_path"（--mask-dir 目录中的文件名）、
+              "width"、"height"、"background_color"、"max_words"、"max_font_size"、
+              "preset"（如 thumbnail）、"layout"（fast 使用快速布局）；字体固定使用服务端的默认字体
+              成功时直接返回图片字节；参数不合法时返回400，队列已满时返回503，请稍后重试
+GET  /health  返回服务状态（JSON）
+"""
+
+import argparse
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from word_cloud_generator import LAYOUT_ENGINES, RENDER_PRESETS
+
+# 允许请求覆盖的WordCloud参数（不包括字体和模板路径，服务不按客户端给出的路径打开文件）
+RENDER_OPTIONS = ('width', 'height', 'background_color', 'max_words', 'max_font_size', 'layout')
+
+# 整数参数的取值范围（含两端）
+INTEGER_OPTIONS = {
+    'width': (1, 8192),
+    'height': (1, 8192),
+    'max_words': (1, 10000),
+    'max_font_size': (1, 2048),
+}
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# 单个请求体的大小上限
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# 工作进程内常驻的状态（分词缓存等），由 _init_worker 创建
+_worker_state = {}
+
+
+def _init_worker(token_cache_path):
+    """工作进程初始化：加载jieba词典、导入渲染库、打开分词缓存，之后的请求都复用它们"""
+    from jieba_dict_cache import load_jieba
+    from token_cache import TokenCache
+
+    load_jieba()
+    import numpy  # noqa: F401
+    import wordcloud  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+    _worker_state['token_cache'] = TokenCache(token_cache_path) if token_cache_path else None
+
+
+def render_job(payload):
+    """
+    在工作进程中渲染一个词云
+
+    参数:
+    payload: 已校验的请求内容
+
+    返回:
+    bytes: 图片内容
+    """
+    from token_cache import count_line_tokens
+    from word_cloud_generator import clean_text, count_tokens, render_word_cloud
+
+    if 'frequencies' in payload:
+        frequencies = payload['frequencies']
+    else:
+        lines = clean_text(payload['text']).splitlines()
+        frequencies = count_tokens((), counter=count_line_tokens(lines, _worker_state.get('token_cache')))
+
+    options = {key: payload[key] for key in RENDER_OPTIONS if key in payload}
+    return render_word_cloud(frequencies, mask_path=payload.get('mask_path'),
+                             image_format=payload.get('format', 'png'), preset=payload.get('preset'), **options)
+
+
+def resolve_mask_path(name, mask_dir):
+    """
+    把请求中的模板文件名解析为 mask_dir 中的文件路径
+
+    返回:
+    str: 模板文件的绝对路径；mask_dir 为None、路径跳出 mask_dir 或文件不存在时返回None
+    """
+    if not mask_dir or not isinstance(name, str):
+        return None
+    root = os.path.realpath(mask_dir)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def validate_payload(payload, mask_dir=None):
+    """
+    在进入队列前检查请求内容，格式错误的请求不占用工作进程；
+    合法时把 mask_path 替换为 mask_dir 中对应文件的绝对路径
+
+    参数:
+    payload: 解析后的请求体
+    mask_dir: 允许使用的形状模板目录，为None时不接受 mask_path
+
+    返回:
+    str: 错误信息，合法时返回None
+    """
+    if not isinstance(payload, dict):
+        return "请求体必须是JSON对象"
+    if 'font_path' in payload:
+        return "不支持 font_path，服务使用固定的字体"
+    if payload.get('mask_path') is not None:
+        mask_path = resolve_mask_path(payload['mask_path'], mask_dir)
+        if mask_path is None:
+            return f"找不到形状模板: {payload['mask_path']}"
+        payload['mask_path'] = mask_path
+    for key, (low, high) in INTEGER_OPTIONS.items():
+        value = payload.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high):
+            return f"{key} 必须是 {low} 到 {high} 之间的整数"
+    if payload.get('background_color') is not None and not isinstance(payload['background_color'], str):
+        return "background_color 必须是字符串"
+    if payload.get('format', 'png') not in CONTENT_TYPES:
+        return f"不支持的格式: {payload.get('format')}"
+    if payload.get('preset') is not None and payload['preset'] not in RENDER_PRESETS:
+        return f"未知的渲染预设: {payload['preset']}"
+    if payload.get('layout') is not None and payload['layout'] not in LAYOUT_ENGINES:
+        return f"未知的布局引擎: {payload['layout']}"
+    if 'frequencies' in payload:
+        frequencies = payload['frequencies']
+        if not isinstance(frequencies, dict) or not all(
+                isinstance(count, (int, float)) and not isinstance(count, bool) and math.isfinite(count) and count > 0
+                for count in frequencies.values()):
+            return "frequencies 必须是词语到正数的映射"
+    elif not isinstance(payload.get('text'), str):
+        return "需要提供 text 或 frequencies"
+    return None
+
+
+class RenderService:
+    """
+    有界的渲染进程池
+
+    同时处理的请求数为 workers，另有 queue_size 个排队位置；
+    全部占满时 submit 立即返回None，由调用方拒绝请求，实现背压
+
+    参数:
+    workers: 工作进程数
+    queue_size: 排队等待的最大请求数
+    token_cache_path: 工作进程使用的分词缓存路径，为None时不使用缓存
+    """
+
+    def __init__(self, workers=4, queue_size=32, token_cache_path=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.token_cache_path = token_cache_path
+        self._executor = self._new_executor()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._stats = {'in_flight': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'restarts': 0}
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.token_cache_path,))
+
+    def _restart(self, broken):
+        """工作进程异常退出（OOM、被kill等）后进程池不可再用，换一个新的进程池；已被其他线程换过时什么也不做"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self._stats['restarts'] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, payload):
+        """
+        提交渲染任务，返回Future；没有空闲位置时返回None
+
+        进程池已损坏时归还占用的位置、重建进程池并抛出 BrokenProcessPool，由调用方返回错误，之后的请求照常处理
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            return None
+
+        with self._lock:
+            self._stats['in_flight'] += 1
+            executor = self._executor
+        try:
+            future = executor.submit(render_job, payload)
+        except (BrokenProcessPool, RuntimeError):
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats['failed'] += 1
+            self._slots.release()
+            self._restart(executor)
+            raise BrokenProcessPool("渲染进程异常退出，进程池已重建")
+        future.add_done_callback(lambda done: self._on_done(done, executor))
+        return future
+
+    def _on_done(self, future, executor):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            error = None if future.cancelled() else future.exception()
+            failed = future.cancelled() or error is not None
+            self._stats['failed' if failed else 'completed'] += 1
+        self._slots.release()
+        # 正在处理的请求所在的工作进程退出时，不等下一个请求出错，立即重建进程池
+        if isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=self.workers, queue_size=self.queue_size)
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """处理 /render 和 /health 请求，service、timeout_seconds 和 mask_dir 由 make_server 设置"""
+
+    service = None
+    timeout_seconds = 60
+    mask_dir = None
+
+    def address_string(self):
+        # Unix socket 连接没有客户端地址
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def _send(self, status, body, content_type='application/json; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers=headers)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {'error': "未知路径"})
+
+    def do_POST(self):
+        if self.path != '/render':
+            self._send_json(404, {'error': "未知路径"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': "Content-Length 不合法"})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {'error': "请求体过大"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            self._send_json(400, {'error': "请求体不是合法的JSON"})
+            return
+
+        error = validate_payload(payload, self.mask_dir)
+        if error:
+            self._send_json(400, {'error': error})
+            return
+
+        try:
+            future = self.service.submit(payload)
+        except BrokenProcessPool as e:
+            self._send_json(503, {'error': str(e)}, headers={'Retry-After': '1'})
+            return
+        if future is None:
+            self._send_json(503, {'error': "渲染队列已满，请稍后重试"}, headers={'Retry-After': '1'})
+            return
+
+        try:
+            image = future.result(timeout=self.timeout_seconds)
+        except TimeoutError:
+            self._send_json(504, {'error': "渲染超时"})
+        except BrokenProcessPool:
+            self._send_json(503, {'error': "渲染进程异常退出，请重试"}, headers={'Retry-After': '1'})
+        except ValueError as e:
+            # 例如文本中没有可用的词语
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': f"渲染失败: {e}"})
+        else:
+            self._send(200, image, CONTENT_TYPES[payload.get('format', 'png')])
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """监听Unix socket的HTTP服务"""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None, timeout_seconds=60, mask_dir=None):
+    """创建绑定到 service 的HTTP服务（TCP或Unix socket），请求只能使用 mask_dir 中的形状模板"""
+    handler = type('BoundRenderRequestHandler', (RenderRequestHandler,),
+                   {'service': service, 'timeout_seconds': timeout_seconds, 'mask_dir': mask_dir})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="词云渲染服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认127.0.0.1）")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口（默认8765）")
+    parser.add_argument('--socket', dest='socket_path', help="改为监听Unix socket")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="渲染进程数（默认CPU核心数）")
+    parser.add_argument('--queue-size', type=int, default=32, help="最多排队的请求数（默认32）")
+    parser.add_argument('--timeout', type=float, default=60, help="单个请求的超时时间，秒（默认60）")
+    parser.add_argument('--mask-dir', help="允许请求通过 mask_path 使用的形状模板目录（默认不允许使用模板）")
+    parser.add_argument('--token-cache', default=None,
+                        help="分词缓存路径（默认.cache/tokens.sqlite），传入空字符串关闭缓存")
+    args = parser.parse_args()
+
+    from token_cache import DEFAULT_CACHE_PATH
+
+    token_cache_path = DEFAULT_CACHE_PATH if args.token_cache is None else (args.token_cache or None)
+    service = RenderService(args.workers, args.queue_size, token_cache_path)
+    server = make_server(service, args.host, args.port, args.socket_path, args.timeout, args.mask_dir)
+
+    where = args.socket_path or f"http://{args.host}:{args.port}"
+    print(f"词云渲染服务已启动: {where}（{args.workers} 个进程，队列 {args.queue_size}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在关闭服务...")
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.socket_path and os.path.exists(args.socket_path):
+            os.remove(args.socket_path)
+
+
+if __name__ == "__main__":
+    main()
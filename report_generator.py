@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分析报告生成
+功能：由分析流程的输出（results.json、各词云图片、情感轨迹图）生成 analysis_results/report.html。
+      报告的每个片段都按其输入的哈希缓存在 .cache/report 中，再次生成时只重新渲染数据有变化的片段；
+      多份报告可以共用一个缓存目录，每份报告记录自己用到的片段，清理时只删除没有任何报告引用的片段；
+      图片以限制尺寸的WebP（不支持时为PNG）缩略图内嵌，点击打开原图，
+      上百张分场景词云的报告也能在几秒内生成、在浏览器中很快打开
+
+用法:
+python report_generator.py                      # 读取 analysis_results，写出 analysis_results/report.html
+python report_generator.py -i analysis_results -o report.html --thumbnail-size 480
+"""
+
+import argparse
+import base64
+import glob
+import hashlib
+import html
+import io
+import json
+import multiprocessing
+import os
+
+from dialogue_extractor import file_digest, resolve_workers
+
+DEFAULT_RESULTS_DIR = 'analysis_results'
+DEFAULT_REPORT_PATH = os.path.join(DEFAULT_RESULTS_DIR, 'report.html')
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'report')
+
+# 片段格式版本，模板或缩略图编码方式变化时旧缓存自动失效
+FRAGMENT_VERSION = 1
+
+# 缩略图的最大边长（像素）
+DEFAULT_THUMBNAIL_SIZE = 360
+
+# 缩略图的WebP质量
+THUMBNAIL_QUALITY = 70
+
+# 主词云（总体、积极、消极）的文件名和标题
+MAIN_CLOUDS = (
+    ('wordcloud.png', '总体词云', '总体词云展示了Caleb对话中最常用的词汇，词汇大小代表使用频率。'),
+    ('positive_wordcloud.png', '积极词汇词云', '展示Caleb使用的积极情感词汇，反映他的正面性格特点。'),
+    ('negative_wordcloud.png', '消极词汇词云', '展示Caleb使用的消极情感词汇，反映他可能的担忧或负面情绪。'),
+)
+
+# batch_renderer 写出的分组词云目录及其标题
+GALLERIES = (('scenes', '分场景词云'), ('speakers', '分角色词云'))
+
+# sentiment_trajectory 默认写出的情感变化图
+TRAJECTORY_CHART = 'sentiment_trajectory.png'
+
+STYLE = """
+        body { font-family: 'Microsoft YaHei', Arial, sans-serif; line-height: 1.6; color: #333;
+               max-width: 1200px; margin: 0 auto; padding: 20px; background-color: #f5f5f5; }
+        .container { background-color: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                     padding: 30px; margin-bottom: 20px; }
+        h1, h2, h3 { color: #2c3e50; }
+        h1 { text-align: center; margin-bottom: 30px; color: #3498db; }
+        .result-section { margin-bottom: 30px; }
+        .wordcloud-preview { border: 1px solid #ddd; border-radius: 4px; padding: 15px; background-color: #f9f9f9;
+                             text-align: center; margin: 20px 0; }
+        .wordcloud-preview img, .gallery img { max-width: 100%; height: auto; border-radius: 4px;
+                                               box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
+        .gallery { display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 15px; }
+        .gallery figure { margin: 0; text-align: center; }
+        .gallery figcaption { font-size: 0.9em; color: #666; word-break: break-all; }
+        .placeholder { background-color: #e1e1e1; padding: 40px; color: #666; border-radius: 4px; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #3498db; color: white; }
+        tr:hover { background-color: #f5f5f5; }
+"""
+
+
+class FragmentCache:
+    """
+    按输入哈希缓存的HTML片段，每个片段一个文件
+
+    参数:
+    cache_dir: 缓存目录
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(kind, inputs):
+        """片段的缓存键：片段类型和输入（可JSON序列化）的SHA-1"""
+        payload = json.dumps([FRAGMENT_VERSION, kind, inputs], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.html')
+
+    def get(self, key):
+        self._used.add(key)
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                fragment = f.read()
+        except OSError:
+            return None
+        self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        self._used.add(key)
+        self.misses += 1
+        tmp_path = self._path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(fragment)
+        os.replace(tmp_path, self._path(key))
+
+    def render(self, kind, inputs, render):
+        """命中时直接返回缓存的片段，否则调用 render() 生成并写入缓存"""
+        key = self.key(kind, inputs)
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = render()
+            self.put(key, fragment)
+        return fragment
+
+    def _manifest_path(self, report_path):
+        name = hashlib.sha1(os.path.abspath(report_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'reports', name + '.json')
+
+    def _referenced(self):
+        """仍然存在的报告引用的全部片段；报告文件已删除的清单一并删除"""
+        referenced = set()
+        for path in glob.glob(os.path.join(self.cache_dir, 'reports', '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if os.path.exists(manifest['report_path']):
+                referenced.update(manifest['keys'])
+            else:
+                os.remove(path)
+        return referenced
+
+    def prune(self, report_path):
+        """
+        记录 report_path 本次用到的片段，并删除没有任何报告引用的片段，缓存大小不随历次运行增长。
+        共用缓存目录的其他报告所用的片段保留
+
+        返回:
+        int: 删除的片段数
+        """
+        manifest_path = self._manifest_path(report_path)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = manifest_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'report_path': os.path.abspath(report_path), 'keys': sorted(self._used)}, f)
+        os.replace(tmp_path, manifest_path)
+
+        referenced = self._referenced()
+        removed = 0
+        for path in glob.glob(os.path.join(self.cache_dir, '*.html')):
+            if os.path.splitext(os.path.basename(path))[0] not in referenced:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+def thumbnail_data_uri(image_path, max_size=DEFAULT_THUMBNAIL_SIZE):
+    """
+    把图片缩小到最大边长 max_size 并编码为 data URI，支持WebP时用WebP，否则用PNG
+
+    返回:
+    (data_uri, width, height) 元组
+    """
+    from PIL import Image, features
+
+    with Image.open(image_path) as image:
+        # reducing_gap 让大图先按整数倍快速缩小，再做高质量重采样
+        image.thumbnail((max_size, max_size), reducing_gap=1.0)
+        buffer = io.BytesIO()
+        if features.check('webp'):
+            image.save(buffer, format='WEBP', quality=THUMBNAIL_QUALITY, method=4)
+            mime = 'image/webp'
+        else:
+            image.save(buffer, format='PNG', optimize=True)
+            mime = 'image/png'
+        width, height = image.size
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}", width, height
+
+
+def _image_inputs(image_path, report_dir, max_size):
+    """图片片段的输入：图片内容的摘要、链接路径和缩略图尺寸"""
+    return {
+        'sha1': file_digest(image_path),
+        'href': os.path.relpath(image_path, report_dir).replace(os.sep, '/'),
+        'max_size': max_size,
+    }
+
+
+def _render_figure(job):
+    """生成一张图片的片段：内嵌缩略图，点击打开原图（原图只在打开链接时加载）"""
+    image_path, caption, inputs = job
+    data_uri, width, height = thumbnail_data_uri(image_path, inputs['max_size'])
+    href = html.escape(inputs['href'], quote=True)
+    return (f'<figure><a href="{href}" target="_blank">'
+            f'<img src="{data_uri}" width="{width}" height="{height}" loading="lazy" decoding="async" '
+            f'alt="{html.escape(caption, quote=True)}"></a>'
+            f'<figcaption>{html.escape(caption)}</figcaption></figure>')
+
+
+def render_figures(images, cache, report_dir, max_size=DEFAULT_THUMBNAIL_SIZE, workers=1):
+    """
+    生成多张图片的片段，只为缓存未命中的图片解码和缩放，未命中的图片较多时并行处理
+
+    参数:
+    images: (图片路径, 标题) 列表
+    workers: 进程数，1为串行，0表示使用全部CPU核心
+
+    返回:
+    list: 与 images 顺序一致的HTML片段
+    """
+    fragments = [None] * len(images)
+    jobs = []
+    for index, (image_path, caption) in enumerate(images):
+        inputs = dict(_image_inputs(image_path, report_dir, max_size), caption=caption)
+        key = cache.key('figure', inputs)
+        fragments[index] = cache.get(key)
+        if fragments[index] is None:
+            jobs.append((index, key, (image_path, caption, inputs)))
+
+    workers = min(resolve_workers(workers), len(jobs))
+    if workers <= 1:
+        rendered = [_render_figure(job) for _, _, job in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            rendered = pool.map(_render_figure, [job for _, _, job in jobs])
+    for (index, key, _), fragment in zip(jobs, rendered):
+        cache.put(key, fragment)
+        fragments[index] = fragment
+    return fragments
+
+
+def _render_sentiment(sentiment):
+    rows = []
+    for label, name in (('positive', '积极'), ('negative', '消极'), ('neutral', '中性')):
+        rows.append(f"<tr><td>{name}</td><td>{sentiment.get(label, 0)}</td>"
+                    f"<td>{sentiment.get(label + '_ratio', 0.0):.2%}</td></tr>")
+    return ('<div class="result-section"><h2>情感分析结果</h2>'
+            '<table><tr><th>情感类别</th><th>对话数</th><th>百分比</th></tr>' + ''.join(rows) + '</table>'
+            f"<p>平均情感得分：{sentiment.get('average_score', 0.0):.4f}</p></div>")
+
+
+def _render_keywords(keywords):
+    if not keywords:
+        return '<div class="result-section"><h2>关键词（TF-IDF）</h2><p>没有提取到关键词。</p></div>'
+    rows = ''.join(f"<tr><td>{rank}</td><td>{html.escape(word)}</td><td>{score:.4f}</td></tr>"
+                   for rank, (word, score) in enumerate(keywords, 1))
+    return ('<div class="result-section"><h2>关键词（TF-IDF）</h2>'
+            '<table><tr><th>排名</th><th>关键词</th><th>得分</th></tr>' + rows + '</table></div>')
+
+
+def _render_overview(results):
+    parts = [f"共分析 {results.get('n_dialogues', 0)} 条对话"]
+    if results.get('n_unique_dialogues', results.get('n_dialogues')) != results.get('n_dialogues'):
+        parts.append(f"去重后 {results['n_unique_dialogues']} 条")
+    source = results.get('source_file')
+    if source:
+        parts.append(f"来源：{html.escape(str(source))}")
+    return ('<div class="result-section"><h2>分析概述</h2><p>' + '，'.join(parts) + '。</p></div>')
+
+
+def load_results(results_dir):
+    """读取分析器写出的 results.json，不存在时返回空字典"""
+    from character_dialogue_analyzer import RESULTS_FILE
+
+    try:
+        with open(os.path.join(results_dir, RESULTS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_report(results_dir=DEFAULT_RESULTS_DIR, report_path=DEFAULT_REPORT_PATH, cache_dir=DEFAULT_CACHE_DIR,
+                 thumbnail_size=DEFAULT_THUMBNAIL_SIZE, workers=1):
+    """
+    生成HTML报告，各片段命中缓存时直接复用
+
+    参数:
+    results_dir: 分析结果目录（results.json、词云图片、scenes/、speakers/ 子目录）
+    report_path: 输出的HTML路径
+    cache_dir: 片段缓存目录
+    thumbnail_size: 缩略图最大边长
+    workers: 生成缩略图的进程数，1为串行，0表示使用全部CPU核心
+
+    返回:
+    FragmentCache: 其中 hits、misses 为复用和重新生成的片段数
+    """
+    report_dir = os.path.dirname(os.path.abspath(report_path))
+    cache = FragmentCache(cache_dir)
+    results = load_results(results_dir)
+    overview = {key: results.get(key) for key in ('source_file', 'n_dialogues', 'n_unique_dialogues')}
+    sections = [cache.render('overview', overview, lambda: _render_overview(results))]
+
+    # 主词云
+    clouds = [(os.path.join(results_dir, filename), title, note) for filename, title, note in MAIN_CLOUDS]
+    existing = [(path, title) for path, title, _ in clouds if os.path.exists(path)]
+    figures = iter(render_figures(existing, cache, report_dir, thumbnail_size, workers))
+    parts = ['<div class="result-section"><h2>词云分析结果</h2>']
+    for number, (path, title, note) in enumerate(clouds, 1):
+        figure = next(figures) if os.path.exists(path) else (
+            '<div class="placeholder">尚未生成，运行 analyze_caleb_dialogues.py 后重新生成报告</div>')
+        parts.append(f'<h3>{number}. {title}</h3><div class="wordcloud-preview">{figure}'
+                     f'<p><em>词云说明：</em>{note}</p></div>')
+    parts.append('</div>')
+    sections.append(''.join(parts))
+
+    if 'sentiment' in results:
+        sections.append(cache.render('sentiment', results['sentiment'], lambda: _render_sentiment(results['sentiment'])))
+    if 'keywords' in results:
+        sections.append(cache.render('keywords', results['keywords'], lambda: _render_keywords(results['keywords'])))
+
+    trajectory = os.path.join(results_dir, TRAJECTORY_CHART)
+    if os.path.exists(trajectory):
+        figure, = render_figures([(trajectory, '情感变化轨迹')], cache, report_dir, max(thumbnail_size, 800), workers)
+        sections.append(f'<div class="result-section"><h2>情感变化轨迹</h2>'
+                        f'<div class="wordcloud-preview">{figure}</div></div>')
+
+    # 分场景、分角色词云（batch_renderer 的输出），每张图一个片段
+    for subdir, title in GALLERIES:
+        paths = sorted(glob.glob(os.path.join(results_dir, subdir, '*.png')))
+        if not paths:
+            continue
+        images = [(path, os.path.splitext(os.path.basename(path))[0]) for path in paths]
+        figures = render_figures(images, cache, report_dir, thumbnail_size, workers)
+        sections.append(f'<div class="result-section"><h2>{title}（{len(paths)} 张）</h2>'
+                        f'<div class="gallery">{"".join(figures)}</div></div>')
+
+    page = ('<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="UTF-8">\n'
+            '<meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+            f'<title>Caleb对话分析结果</title>\n<style>{STYLE}</style>\n</head>\n<body>\n'
+            '<div class="container">\n<h1>Caleb对话分析结果</h1>\n' + '\n'.join(sections) +
+            f'\n<p><em>本页由 report_generator.py 根据 {html.escape(results_dir)} 中的结果生成，'
+            '运行 python analyze_caleb_dialogues.py 即可更新。</em></p>'
+            '\n</div>\n</body>\n</html>\n')
+
+    os.makedirs(report_dir, exist_ok=True)
+    tmp_path = report_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    os.replace(tmp_path, report_path)
+    cache.prune(report_path)
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由分析结果生成HTML报告，只重新生成有变化的部分")
+    parser.add_argument('-i', '--results-dir', default=DEFAULT_RESULTS_DIR,
+                        help=f"分析结果目录（默认{DEFAULT_RESULTS_DIR}）")
+    parser.add_argument('-o', '--output', default=DEFAULT_REPORT_PATH, help=f"报告路径（默认{DEFAULT_REPORT_PATH}）")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f"片段缓存目录（默认{DEFAULT_CACHE_DIR}）")
+    parser.add_argument('--thumbnail-size', type=int, default=DEFAULT_THUMBNAIL_SIZE,
+                        help=f"缩略图最大边长（默认{DEFAULT_THUMBNAIL_SIZE}）")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help="生成缩略图的进程数，0表示使用全部CPU核心（默认0）")
+    args = parser.parse_args()
+
+    cache = build_report(args.results_dir, args.output, args.cache_dir, args.thumbnail_size, args.workers)
+    print(f"报告已保存到: {args.output}（复用 {cache.hits} 个片段，重新生成 {cache.misses} 个）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+情感变化轨迹
+功能：按文件和轮次顺序流式读取对话，为每个场景和每个对话对象分别维护累计平均和滑动窗口平均
+      情感得分，一边读一边把时间序列写入CSV或Parquet，不把语料整体载入内存；
+      同时保留降采样后的序列，结束时画出情感变化图
+
+每条对话的得分与 CharacterDialogueAnalyzer.analyze_sentiment 相同：(积极词数 - 消极词数) / 总词数。
+对话对象取该轮之前说话的角色（即被回应的一方），文件的第一轮没有对话对象
+
+用法:
+python sentiment_trajectory.py Caleb_data -o analysis_results/sentiment_trajectory.csv --window 20
+python sentiment_trajectory.py Caleb_data -o trajectory.parquet --every 10 --chart trajectory.png
+"""
+
+import argparse
+import csv
+import os
+from collections import deque
+
+from character_dialogue_analyzer import (DEFAULT_NEGATIVE_WORDS, DEFAULT_POSITIVE_WORDS, load_word_list,
+                                         sentiment_hits, sentiment_matcher)
+from dialogue_extractor import DEFAULT_SPEAKERS, iter_folder_turns, speaker_key
+
+DEFAULT_OUTPUT = os.path.join('analysis_results', 'sentiment_trajectory.csv')
+
+# 默认的滑动窗口大小（对话条数）
+DEFAULT_WINDOW = 20
+
+# 没有对话对象（文件的第一轮）时使用的名称
+NO_ADDRESSEE = '（无）'
+
+# 图表中每条曲线最多保留的点数
+CHART_POINTS = 2000
+
+# 图表中展示的对话对象数量
+CHART_ADDRESSEES = 10
+
+FIELDS = ('group', 'key', 'scene', 'line_no', 'turn_index', 'n', 'score', 'running_mean', 'window_mean')
+
+# 写入Parquet时每个行组的行数
+PARQUET_BATCH_ROWS = 65536
+
+
+class RunningMean:
+    """累计平均，只保存条数和总和"""
+
+    __slots__ = ('n', 'total')
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+
+class SlidingMean:
+    """
+    最近 size 个值的平均
+
+    只保存窗口内的值和它们的和，每次更新的代价与窗口大小无关，内存与语料长度无关
+    """
+
+    __slots__ = ('values', 'total')
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+
+    def add(self, value):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else 0.0
+
+
+class DecimatedSeries:
+    """
+    有上限的降采样序列：点数达到 max_points 时丢弃一半，之后每隔一倍的间隔才保留一个点，
+    保留的点始终在整个序列上大致均匀分布
+    """
+
+    def __init__(self, max_points=CHART_POINTS):
+        self.max_points = max_points
+        self.stride = 1
+        self.points = []
+        self._seen = 0
+
+    def add(self, x, y):
+        if self._seen % self.stride == 0:
+            self.points.append((x, y))
+            if len(self.points) >= self.max_points:
+                self.points = self.points[::2]
+                self.stride *= 2
+        self._seen += 1
+
+
+class GroupTrajectory:
+    """一个分组（场景或对话对象）的累计平均和滑动窗口平均"""
+
+    __slots__ = ('running', 'window')
+
+    def __init__(self, window):
+        self.running = RunningMean()
+        self.window = SlidingMean(window)
+
+    def add(self, score):
+        self.running.add(score)
+        self.window.add(score)
+
+
+class TrajectoryAggregator:
+    """
+    按到达顺序消费对话得分，维护总体、各场景和各对话对象的情感轨迹
+
+    场景按文件顺序依次出现，一个场景结束后它的滑动窗口即被释放，最终平均值只进入降采样序列；
+    对话对象的数量通常有限，它们的窗口一直保留
+
+    参数:
+    window: 滑动窗口大小（对话条数）
+    every: 每个分组每隔多少条对话输出一行，场景结束时总会输出该场景的最后一行
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, every=1):
+        self.window = window
+        self.every = max(1, int(every))
+        self.overall = GroupTrajectory(window)
+        self.addressees = {}
+        self.n_scenes = 0
+        self.overall_series = DecimatedSeries()
+        self.scene_series = DecimatedSeries()
+        self._scene = None
+        self._scene_group = None
+        self._last_turn = None
+
+    def _row(self, group, key, trajectory, scene, line_no, turn_index, score):
+        return {
+            'group': group,
+            'key': key,
+            'scene': scene,
+            'line_no': line_no,
+            'turn_index': turn_index,
+            'n': trajectory.running.n,
+            'score': round(score, 6),
+            'running_mean': round(trajectory.running.mean, 6),
+            'window_mean': round(trajectory.window.mean, 6),
+        }
+
+    def _close_scene(self):
+        """结束当前场景，必要时补出它的最后一行"""
+        if self._scene_group is None:
+            return []
+        rows = []
+        if self._scene_group.running.n % self.every:
+            rows.append(self._row('scene', self._scene, self._scene_group, self._scene, *self._last_turn))
+        self.n_scenes += 1
+        self.scene_series.add(self.n_scenes, self._scene_group.running.mean)
+        self._scene = self._scene_group = self._last_turn = None
+        return rows
+
+    def add(self, scene, line_no, turn_index, addressee, score):
+        """
+        加入一条对话的得分
+
+        返回:
+        list: 需要输出的时间序列行（字典）
+        """
+        rows = []
+        if scene != self._scene:
+            rows.extend(self._close_scene())
+            self._scene = scene
+            self._scene_group = GroupTrajectory(self.window)
+
+        addressee = addressee or NO_ADDRESSEE
+        if addressee not in self.addressees:
+            self.addressees[addressee] = GroupTrajectory(self.window)
+
+        for group, key, trajectory in (('all', '', self.overall),
+                                       ('scene', scene, self._scene_group),
+                                       ('addressee', addressee, self.addressees[addressee])):
+            trajectory.add(score)
+            if trajectory.running.n % self.every == 0:
+                rows.append(self._row(group, key, trajectory, scene, line_no, turn_index, score))
+
+        self._last_turn = (line_no, turn_index, score)
+        self.overall_series.add(self.overall.running.n, self.overall.window.mean)
+        return rows
+
+    def close(self):
+        """结束最后一个场景，返回需要补出的行"""
+        return self._close_scene()
+
+
+def iter_scored_turns(input_folder, speakers=DEFAULT_SPEAKERS, matcher=None, token_cache=None, workers=1):
+    """
+    按文件和轮次顺序产出 speakers 每条对话的情感得分
+
+    产出:
+    (scene, line_no, turn_index, addressee, score) 元组，addressee 为上一轮的角色，第一轮为None
+    """
+    from token_cache import iter_line_tokens
+    from word_cloud_generator import clean_text
+
+    if matcher is None:
+        matcher = sentiment_matcher(load_word_list('positive_words.txt', DEFAULT_POSITIVE_WORDS),
+                                    load_word_list('negative_words.txt', DEFAULT_NEGATIVE_WORDS))
+    speakers = {speaker_key(speaker) for speaker in speakers}
+
+    # iter_line_tokens 按输入顺序产出结果，每条对话的位置信息按读取顺序排队，与分词结果一一对应
+    positions = deque()
+
+    def lines():
+        # 整个文件夹共用一份角色名映射，同一对话对象不因大小写不同而分成几组
+        for scene, line_no, turn_index, speaker, prev_speaker, text in iter_folder_turns(input_folder):
+            if speaker_key(speaker) in speakers:
+                positions.append((scene, line_no, turn_index, prev_speaker))
+                yield clean_text(text).replace('\n', ' ')
+
+    for tokens in iter_line_tokens(lines(), token_cache, workers):
+        scene, line_no, turn_index, addressee = positions.popleft()
+        if tokens:
+            counts = {'positive': 0, 'negative': 0}
+            for _, label in sentiment_hits(matcher, tokens):
+                counts[label] += 1
+            score = (counts['positive'] - counts['negative']) / len(tokens)
+        else:
+            score = 0.0
+        yield scene, line_no, turn_index, addressee, score
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """按批写入Parquet，内存中最多保留一个行组"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._schema = pa.schema([
+            ('group', pa.string()),
+            ('key', pa.string()),
+            ('scene', pa.string()),
+            ('line_no', pa.int32()),
+            ('turn_index', pa.int32()),
+            ('n', pa.int64()),
+            ('score', pa.float64()),
+            ('running_mean', pa.float64()),
+            ('window_mean', pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= PARQUET_BATCH_ROWS:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_writer(path):
+    """按扩展名选择输出格式：.parquet 写为Parquet，其余写为CSV"""
+    if path.endswith('.parquet'):
+        return _ParquetWriter(path)
+    return _CsvWriter(path)
+
+
+def build_trajectory(input_folder, output_path=DEFAULT_OUTPUT, speakers=DEFAULT_SPEAKERS, window=DEFAULT_WINDOW,
+                     every=1, token_cache=None, workers=1, progress=None):
+    """
+    一遍扫描生成情感轨迹，并把时间序列写入 output_path
+
+    输出的每行属于一个分组：group 为 all（总体）、scene（场景）或 addressee（对话对象），
+    key 为场景路径或对话对象；n 为该分组已累计的对话条数
+
+    参数:
+    input_folder: 对话文件夹
+    output_path: 输出路径，.parquet 结尾时写为Parquet，否则写为CSV
+    speakers: 统计其对话的角色
+    window: 滑动窗口大小（对话条数）
+    every: 每个分组每隔多少条对话输出一行
+    token_cache: TokenCache 实例，提供时复用已缓存的分词结果
+    workers: 分词进程数，1为串行，0表示使用全部CPU核心
+    progress: ProgressReporter 实例，提供时每处理一条对话更新一次
+
+    返回:
+    TrajectoryAggregator: 包含各对话对象的最终平均值和降采样后的总体、场景序列
+    """
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    aggregator = TrajectoryAggregator(window, every)
+    writer = open_writer(output_path)
+    try:
+        for scene, line_no, turn_index, addressee, score in iter_scored_turns(input_folder, speakers,
+                                                                              token_cache=token_cache,
+                                                                              workers=workers):
+            writer.write(aggregator.add(scene, line_no, turn_index, addressee, score))
+            if progress is not None:
+                progress.update()
+        writer.write(aggregator.close())
+    finally:
+        writer.close()
+    return aggregator
+
+
+def plot_trajectory(aggregator, chart_path, font_path='simhei.ttf'):
+    """
+    把总体滑动窗口平均、各场景平均和主要对话对象的平均画成一张图
+
+    曲线使用降采样后的点，绘图代价与语料长度无关
+
+    参数:
+    font_path: 显示对话对象名称的中文字体，找不到时使用matplotlib默认字体
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.font_manager import FontProperties
+
+    from asset_cache import resolve_font_path
+
+    font_path = resolve_font_path(font_path)
+    font = FontProperties(fname=font_path) if os.path.exists(font_path) else None
+
+    figure, (overall_axis, scene_axis, addressee_axis) = plt.subplots(3, 1, figsize=(10, 10))
+
+    if aggregator.overall_series.points:
+        x, y = zip(*aggregator.overall_series.points)
+        overall_axis.plot(x, y, linewidth=1)
+    overall_axis.axhline(0, color='grey', linewidth=0.5)
+    overall_axis.set_title(f"Overall sentiment (window = {aggregator.window})")
+    overall_axis.set_xlabel("dialogue")
+
+    if aggregator.scene_series.points:
+        x, y = zip(*aggregator.scene_series.points)
+        scene_axis.plot(x, y, marker='.', linewidth=1)
+    scene_axis.axhline(0, color='grey', linewidth=0.5)
+    scene_axis.set_title("Mean sentiment per scene")
+    scene_axis.set_xlabel("scene (file order)")
+
+    top = sorted(aggregator.addressees.items(), key=lambda item: item[1].running.n, reverse=True)
+    top = top[:CHART_ADDRESSEES]
+    addressee_axis.barh([name for name, _ in top][::-1], [group.running.mean for _, group in top][::-1])
+    for label in addressee_axis.get_yticklabels():
+        label.set_fontproperties(font)
+    addressee_axis.axvline(0, color='grey', linewidth=0.5)
+    addressee_axis.set_title("Mean sentiment per addressee")
+
+    figure.tight_layout()
+    figure.savefig(chart_path, dpi=100)
+    plt.close(figure)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式计算各场景、各对话对象的情感变化轨迹")
+    parser.add_argument('input_folder', nargs='?', default='Caleb_data', help="对话文件夹（默认Caleb_data）")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                        help=f"时间序列输出路径，.parquet 结尾时写为Parquet（默认{DEFAULT_OUTPUT}）")
+    parser.add_argument('--speakers', nargs='+', default=list(DEFAULT_SPEAKERS), help="统计其对话的角色（默认Caleb）")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f"滑动窗口大小（对话条数，默认{DEFAULT_WINDOW}）")
+    parser.add_argument('--every', type=int, default=1, help="每个分组每隔多少条对话输出一行（默认1）")
+    parser.add_argument('--chart', help="情感变化图的输出路径（默认与时间序列同名的 .png）")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="分词的进程数，0表示使用全部CPU核心（默认1）")
+    args = parser.parse_args()
+
+    from jieba_dict_cache import load_jieba
+    from pipeline_metrics import ProgressReporter
+    from token_cache import TokenCache
+
+    load_jieba()
+    with TokenCache() as token_cache, ProgressReporter("已处理对话") as progress:
+        aggregator = build_trajectory(args.input_folder, args.output, args.speakers, args.window, args.every,
+                                      token_cache, args.workers, progress)
+    print(f"共 {aggregator.overall.running.n} 条对话、{aggregator.n_scenes} 个场景、"
+          f"{len(aggregator.addressees)} 个对话对象，平均情感得分 {aggregator.overall.running.mean:.4f}")
+    print(f"情感轨迹已保存到: {args.output}")
+
+    chart_path = args.chart or os.path.splitext(args.output)[0] + '.png'
+    plot_trajectory(aggregator, chart_path)
+    print(f"情感变化图已保存到: {chart_path}")
+
+
+if __name__ == "__main__":
+    main()
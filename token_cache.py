@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分词缓存模块
+功能：把jieba的分词结果按行持久化到磁盘（SQLite），键为“清理后的行 + 词典版本”的哈希，
+      按最近使用时间淘汰（LRU）并限制总大小，相同文本只需分词一次
+"""
+
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import Counter
+
+import jieba
+
+from dialogue_extractor import resolve_workers
+from jieba_dict_cache import dictionary_fingerprint, load_jieba, loaded_user_dicts
+
+# 默认缓存位置与大小上限
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'tokens.sqlite')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 每批查询/写入的行数，受SQLite单条语句参数个数限制
+BATCH_SIZE = 500
+
+# 并行分词时每个任务包含的行数
+PARALLEL_CHUNK_LINES = 2000
+
+# 分词结果的分隔符，clean_text 之后的文本中不会出现
+TOKEN_SEPARATOR = '\0'
+
+
+def jieba_dictionary_version():
+    """
+    返回当前jieba词典的版本标识
+
+    即主词典和已加载用户词典的指纹，词典变化后旧缓存自动失效
+    """
+    return dictionary_fingerprint(loaded_user_dicts())
+
+
+def _ensure_jieba():
+    """分词前确保词典已从预编译缓存加载，而不是由jieba.cut临时构建"""
+    if not jieba.dt.initialized:
+        load_jieba(loaded_user_dicts())
+
+
+def segment_line(line):
+    """对单行文本分词，去掉空白词"""
+    return [word for word in jieba.cut(line) if word.strip()]
+
+
+def _init_segmenter(user_dicts):
+    """工作进程初始化：每个进程只加载一次jieba词典（fork时直接继承主进程已加载的词典）"""
+    load_jieba(user_dicts)
+
+
+def _segment_chunk(lines):
+    return [segment_line(line) for line in lines]
+
+
+def _count_chunk(lines):
+    counter = Counter()
+    for line in lines:
+        counter.update(segment_line(line))
+    return counter
+
+
+class TokenCache:
+    """
+    基于SQLite的持久化分词缓存
+
+    参数:
+    path: 缓存文件路径
+    max_bytes: 缓存内容总大小上限，超出后淘汰最久未使用的条目
+    dictionary_version: 词典版本标识，默认取 jieba_dictionary_version()
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, dictionary_version=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dictionary_version = dictionary_version or jieba_dictionary_version()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            "key BLOB PRIMARY KEY, tokens TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        self._conn.commit()
+
+    def key(self, line):
+        """计算一行文本的缓存键"""
+        return hashlib.sha1((self.dictionary_version + '\0' + line).encode('utf-8')).digest()
+
+    def get_many(self, keys):
+        """
+        批量查询缓存，并刷新命中条目的最近使用时间
+
+        返回:
+        dict: 命中的键到分词列表的映射
+        """
+        keys = list(keys)
+        placeholders = ','.join('?' * len(keys))
+        rows = self._conn.execute(
+            f"SELECT key, tokens FROM tokens WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        if rows:
+            self._conn.execute(
+                f"UPDATE tokens SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                [time.time()] + [row[0] for row in rows]
+            )
+            # 立即提交，避免多个进程共用缓存时长时间持有写锁
+            self._conn.commit()
+        return {row[0]: (row[1].split(TOKEN_SEPARATOR) if row[1] else []) for row in rows}
+
+    def put_many(self, items):
+        """
+        批量写入缓存
+
+        参数:
+        items: (key, tokens) 元组列表
+        """
+        now = time.time()
+        rows = []
+        for key, tokens in items:
+            value = TOKEN_SEPARATOR.join(tokens)
+            rows.append((key, value, len(key) + len(value.encode('utf-8')), now))
+
+        # 立即取得写锁，总大小在同一事务中重新统计，多个进程共用缓存时也不会超出上限
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)", rows)
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM tokens").fetchone()[0]
+        if total > self.max_bytes:
+            self._evict(total)
+        self._conn.commit()
+
+    def _evict(self, total):
+        """淘汰最久未使用的条目，直到总大小降到上限的90%以下，total 为当前总大小"""
+        target = self.max_bytes * 0.9
+        while total > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM tokens ORDER BY last_used LIMIT ?", (BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= target:
+                    break
+                self._conn.execute("DELETE FROM tokens WHERE key = ?", (key,))
+                total -= size
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _lookup_batch(batch, cache):
+    """
+    查询一批行的缓存
+
+    返回:
+    (keys, found, missing) 元组，missing 为未命中且去重后的 (key, line) 列表
+    """
+    keys = [cache.key(line) for line in batch]
+    found = cache.get_many(set(keys))
+    missing = {}
+    for key, line in zip(keys, batch):
+        if key in found:
+            cache.hits += 1
+        else:
+            cache.misses += 1
+            missing.setdefault(key, line)
+    return keys, found, list(missing.items())
+
+
+def _iter_cached(lines, cache, segment_many, batch_size):
+    """
+    带缓存的分词主循环：查缓存、对未命中的行调用 segment_many、写回缓存，并按原顺序产出
+
+    segment_many 接收若干行列表组成的列表，返回对应的分词结果列表，
+    串行时直接在本进程分词，并行时把各批分发到进程池
+    """
+    batches = _batches(lines, BATCH_SIZE)
+    while True:
+        group = [batch for _, batch in zip(range(batch_size), batches)]
+        if not group:
+            break
+
+        lookups = [_lookup_batch(batch, cache) for batch in group]
+        segmented = segment_many([[line for _, line in missing] for _, _, missing in lookups])
+
+        for (keys, found, missing), results in zip(lookups, segmented):
+            new_items = [(key, tokens) for (key, _), tokens in zip(missing, results)]
+            if new_items:
+                found.update(new_items)
+                cache.put_many(new_items)
+            for key in keys:
+                yield found[key]
+
+
+def iter_line_tokens(lines, cache=None, workers=1):
+    """
+    按行分词，产出每行的分词列表（与输入顺序一致）
+
+    提供 cache 时先查缓存，只对未命中的行调用jieba，并把结果写回缓存；
+    同一批次中重复出现的行也只分词一次。workers 大于1时未命中的行在进程池中并行分词，
+    结果与串行完全一致
+
+    参数:
+    lines: 已清理的文本行（可迭代对象）
+    cache: TokenCache 实例，为None时不使用缓存
+    workers: 分词进程数，1为串行，0或None表示使用全部CPU核心
+
+    产出:
+    list: 每行的分词结果
+    """
+    workers = resolve_workers(workers)
+    _ensure_jieba()
+
+    if workers == 1:
+        if cache is None:
+            for line in lines:
+                yield segment_line(line)
+        else:
+            yield from _iter_cached(lines, cache, lambda chunks: [_segment_chunk(c) for c in chunks], 1)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_segmenter, initargs=(loaded_user_dicts(),)) as pool:
+        if cache is None:
+            for chunk in pool.imap(_segment_chunk, _batches(lines, PARALLEL_CHUNK_LINES)):
+                yield from chunk
+        else:
+            # 每轮为每个进程准备若干批，限制同时驻留内存的行数
+            yield from _iter_cached(lines, cache, lambda chunks: pool.map(_segment_chunk, chunks),
+                                    workers * 4)
+
+
+def count_line_tokens(lines, cache=None, workers=1):
+    """
+    按行分词并统计词频
+
+    不使用缓存且 workers 大于1时，各进程直接返回每块的词频并在主进程合并，
+    避免把全部分词结果传回主进程；各块按原顺序合并，词的先后顺序（词云中频率相同的词的排序）与串行时一致
+
+    参数:
+    lines: 已清理的文本行（可迭代对象）
+    cache: TokenCache 实例，为None时不使用缓存
+    workers: 分词进程数，1为串行，0或None表示使用全部CPU核心
+
+    返回:
+    Counter: 词频统计（未过滤停用词）
+    """
+    counter = Counter()
+    if cache is None and resolve_workers(workers) > 1:
+        _ensure_jieba()
+        with multiprocessing.Pool(resolve_workers(workers), initializer=_init_segmenter,
+                                  initargs=(loaded_user_dicts(),)) as pool:
+            for chunk_counts in pool.imap(_count_chunk, _batches(lines, PARALLEL_CHUNK_LINES)):
+                counter.update(chunk_counts)
+        return counter
+
+    for words in iter_line_tokens(lines, cache, workers):
+        counter.update(words)
+    return counter
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+词ID语料
+功能：各个阶段共用一份词表，把每个词映射为紧凑的整数ID。语料保存为一个扁平的uint32词ID数组
+      和一个标记每条对话边界的偏移数组，可以写入磁盘并以内存映射方式打开；
+      计数、去停用词和词云词频都在ID数组上向量化完成，不再为语料中的每个词保留一个Python字符串
+
+目录格式:
+vocab.txt      词表，第i行为ID为i的词
+token_ids.npy  uint32，全部对话的词ID首尾相接
+offsets.npy    int64，第d条对话的词ID为 token_ids[offsets[d]:offsets[d+1]]
+"""
+
+import os
+from array import array
+
+import numpy as np
+
+VOCABULARY_FILE = 'vocab.txt'
+TOKEN_IDS_FILE = 'token_ids.npy'
+OFFSETS_FILE = 'offsets.npy'
+
+
+class Vocabulary:
+    """
+    词到ID的双向映射，ID按词第一次出现的顺序从0开始分配
+
+    参数:
+    terms: 初始的词，按ID顺序排列
+    """
+
+    def __init__(self, terms=()):
+        self.terms = []
+        self.ids = {}
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.ids
+
+    def __getitem__(self, term_id):
+        return self.terms[term_id]
+
+    def add(self, term):
+        """返回词的ID，新词分配下一个ID"""
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def encode(self, tokens):
+        """把分词结果转换为词ID数组，遇到新词时加入词表"""
+        return array('I', map(self.add, tokens))
+
+    def decode(self, term_ids):
+        """把词ID转换回词（返回词表中已有的字符串，不创建新对象）"""
+        terms = self.terms
+        return [terms[term_id] for term_id in term_ids]
+
+    def mask(self, words):
+        """把词集合转换为按ID索引的布尔数组，词表之外的词被忽略"""
+        mask = np.zeros(len(self.terms), dtype=bool)
+        mask[[self.ids[word] for word in words if word in self.ids]] = True
+        return mask
+
+    def content_mask(self, stopwords=()):
+        """可作为关键词和词云内容的词：非停用词且不是纯数字"""
+        mask = ~self.mask(stopwords)
+        mask &= np.array([not term.isdigit() for term in self.terms], dtype=bool)
+        return mask
+
+    def save(self, path):
+        """写入词表文件（每行一个词），先写临时文件再替换"""
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            for term in self.terms:
+                if '\n' in term:
+                    raise ValueError(f"词中不能包含换行符: {term!r}")
+                f.write(term + '\n')
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # 只按 \n 分行，词中的 \r 等字符原样保留
+        with open(path, 'r', encoding='utf-8', newline='\n') as f:
+            return cls(line[:-1] if line.endswith('\n') else line for line in f)
+
+
+class TokenCorpus:
+    """
+    以词ID数组保存的语料
+
+    参数:
+    vocabulary: Vocabulary
+    token_ids: uint32数组，全部对话的词ID首尾相接
+    offsets: 长度为对话数+1的偏移数组
+    """
+
+    def __init__(self, vocabulary, token_ids, offsets):
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, token_lists, vocabulary=None):
+        """
+        由分词结果构建语料
+
+        参数:
+        token_lists: 每条对话的分词列表（可迭代对象，只遍历一次，不保留这些列表）
+        vocabulary: 共用的词表，为None时新建
+        """
+        vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        token_ids = array('I')
+        offsets = array('q', [0])
+        add = vocabulary.add
+        for tokens in token_lists:
+            token_ids.extend(map(add, tokens))
+            offsets.append(len(token_ids))
+        return cls(vocabulary, np.frombuffer(token_ids, dtype=np.uint32), np.frombuffer(offsets, dtype=np.int64))
+
+    @property
+    def n_docs(self):
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return self.n_docs
+
+    @property
+    def doc_lengths(self):
+        return np.diff(self.offsets)
+
+    def doc(self, index):
+        """第 index 条对话的词ID"""
+        return self.token_ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def tokens(self, index):
+        """第 index 条对话的分词结果"""
+        return self.vocabulary.decode(self.doc(index))
+
+    def token_rows(self):
+        """每个词所属的对话序号"""
+        return np.repeat(np.arange(self.n_docs, dtype=np.int64), self.doc_lengths)
+
+    def term_counts(self, docs=None, doc_weights=None):
+        """
+        每个词的出现次数
+
+        参数:
+        docs: 按对话索引的布尔数组，只统计为True的对话；为None时统计全部
+        doc_weights: 每条对话的权重（如去重后的出现次数）
+
+        返回:
+        numpy.ndarray: 按词ID索引的计数
+        """
+        token_ids = self.token_ids
+        weights = None
+        if doc_weights is not None:
+            weights = np.repeat(np.asarray(doc_weights, dtype=np.float64), self.doc_lengths)
+        if docs is not None:
+            selected = np.repeat(np.asarray(docs, dtype=bool), self.doc_lengths)
+            token_ids = token_ids[selected]
+            weights = weights[selected] if weights is not None else None
+        return np.bincount(token_ids, weights=weights, minlength=len(self.vocabulary))
+
+    def save(self, directory):
+        """写入 directory（见模块说明中的目录格式）"""
+        os.makedirs(directory, exist_ok=True)
+        for name, values in ((TOKEN_IDS_FILE, self.token_ids), (OFFSETS_FILE, self.offsets)):
+            tmp_path = os.path.join(directory, f'{name}.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.asarray(values))
+            os.replace(tmp_path, os.path.join(directory, name))
+        self.vocabulary.save(os.path.join(directory, VOCABULARY_FILE))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        读取 save 写出的语料
+
+        参数:
+        mmap: 为True时以只读内存映射方式打开词ID和偏移数组，不把它们读入内存
+        """
+        mode = 'r' if mmap else None
+        return cls(Vocabulary.load(os.path.join(directory, VOCABULARY_FILE)),
+                   np.load(os.path.join(directory, TOKEN_IDS_FILE), mmap_mode=mode),
+                   np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode=mode))
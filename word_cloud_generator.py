@@ -7,13 +7,35 @@ Word Cloud Generator - 使用Trae AI创建的词云生成工具
 这是一个简单的词云生成器，可以从文本文件中读取内容，生成词云图像。
 """
 
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
-import jieba
-import numpy as np
-from PIL import Image
+import argparse
+import importlib.util
 import re
 import os
+from collections import Counter, defaultdict
+from functools import lru_cache
+from asset_cache import load_mask, resolve_font_path
+from jieba_dict_cache import load_jieba
+from pipeline_metrics import measure
+from token_cache import TokenCache, count_line_tokens, iter_line_tokens
+
+# 渲染预设：thumbnail 为低分辨率缩略图，布局和编码都更快
+RENDER_PRESETS = {
+    'thumbnail': {'width': 200, 'height': 150, 'max_words': 200, 'max_font_size': 50},
+}
+
+# 布局引擎：wordcloud 为WordCloud自带的布局，fast 为 fast_layout 中基于占用索引的布局
+LAYOUT_ENGINES = ('wordcloud', 'fast')
+
+# wordcloud、numpy和PIL导入较慢，只在真正渲染时才导入，
+# 只做分词和统计的调用不必为它们付出启动时间
+
+@lru_cache(maxsize=1)
+def wordcloud_stopwords():
+    """读取wordcloud自带的停用词表，不导入wordcloud包本身"""
+    spec = importlib.util.find_spec('wordcloud')
+    path = os.path.join(spec.submodule_search_locations[0], 'stopwords')
+    with open(path, 'r') as f:
+        return frozenset(line.strip() for line in f)
 
 def clean_text(text):
     """清理文本，去除特殊字符"""
@@ -21,21 +43,106 @@ def clean_text(text):
     text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text)
     return text
 
-def generate_word_cloud(text, output_path='wordcloud.png', mask_path=None):
+def iter_text_tokens(text, token_cache=None, workers=1):
     """
-    生成词云
+    清理文本并逐行分词，以生成器方式逐个产出词语
     
     参数:
     text: 要分析的文本
-    output_path: 输出图片路径
+    token_cache: TokenCache 实例，提供时已分过词的行直接从缓存读取
+    workers: 分词进程数，1为串行，0表示使用全部CPU核心
+    """
+    for words in iter_line_tokens(clean_text(text).splitlines(), token_cache, workers):
+        yield from words
+
+def count_tokens(tokens, counter=None, stopwords=None):
+    """
+    流式统计词频，内存占用只与词汇量有关，与语料大小无关
+    
+    过滤规则与WordCloud.generate一致：去掉纯数字和停用词
+    
+    参数:
+    tokens: 词语的可迭代对象（可以是生成器）
+    counter: 已有的Counter，提供时在其基础上累加
+    stopwords: 停用词集合（不区分大小写），默认使用wordcloud自带的停用词表
+    
+    返回:
+    Counter: 词频统计
+    """
+    if counter is None:
+        counter = Counter()
+    counter.update(tokens)
+    
+    if stopwords is None:
+        stopwords = wordcloud_stopwords()
+    stopwords = {word.lower() for word in stopwords}
+    for word in list(counter):
+        if word.isdigit() or word.lower() in stopwords:
+            del counter[word]
+    return counter
+
+def fold_frequencies(frequencies):
+    """
+    合并大小写不同的同一个词以及英文复数形式，与WordCloud.generate的处理一致
+    
+    参数:
+    frequencies: 词到频次的映射
+    
+    返回:
+    dict: 合并后的词频，每组取出现最多的写法
+    """
+    groups = defaultdict(dict)
+    for word, count in frequencies.items():
+        case_dict = groups[word.lower()]
+        case_dict[word] = case_dict.get(word, 0) + count
+    
+    # 复数并入单数（以s结尾但不以ss结尾，且单数形式存在）
+    for key in list(groups):
+        if key.endswith('s') and not key.endswith('ss') and key[:-1] in groups:
+            singular_dict = groups[key[:-1]]
+            for word, count in groups.pop(key).items():
+                singular_dict[word[:-1]] = singular_dict.get(word[:-1], 0) + count
+    
+    folded = {}
+    for case_dict in groups.values():
+        first = max(case_dict.items(), key=lambda item: item[1])[0]
+        folded[first] = sum(case_dict.values())
+    return folded
+
+def frequencies_from_array(vocabulary, counts):
+    """
+    把NumPy计数数组转换为词频字典，只保留频次大于0的词
+    
+    参数:
+    vocabulary: 词表，下标与counts对应
+    counts: NumPy数组，counts[i]为vocabulary[i]的频次
+    """
+    import numpy as np
+    
+    counts = np.asarray(counts)
+    return {vocabulary[i]: float(counts[i]) for i in np.flatnonzero(counts > 0)}
+
+def build_word_cloud(frequencies, mask_path=None, vocabulary=None, layout=None, **options):
+    """
+    根据词频布局词云，只返回WordCloud对象，不写文件也不创建图形窗口
+    
+    参数:
+    frequencies: 词到频次的映射（如Counter），或与vocabulary对应的NumPy计数数组
     mask_path: 词云形状模板路径
+    vocabulary: frequencies为数组时对应的词表
+    layout: 布局引擎，'fast' 使用 fast_layout（词多、画布大时快得多），默认使用WordCloud自带的布局
+    options: 覆盖默认WordCloud参数，如 width、height、background_color
+    
+    返回:
+    WordCloud: 已完成布局的词云对象
     """
-    # 清理文本
-    text = clean_text(text)
+    # wordcloud导入时会加载pyplot，这里固定使用无界面的Agg后端，避免启动图形界面
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from wordcloud import WordCloud
     
-    # 使用jieba进行中文分词
-    words = jieba.cut(text)
-    words_str = ' '.join(words)
+    if vocabulary is not None:
+        frequencies = frequencies_from_array(vocabulary, frequencies)
+    frequencies = fold_frequencies(frequencies)
     
     # 设置词云参数
     wc_kwargs = {
@@ -47,43 +154,147 @@ def generate_word_cloud(text, output_path='wordcloud.png', mask_path=None):
         'height': 600,
         'collocations': False
     }
+    wc_kwargs.update(options)
+    wc_kwargs['font_path'] = resolve_font_path(wc_kwargs['font_path'])
     
-    # 如果提供了形状模板
+    # 如果提供了形状模板（解码结果在进程内缓存，重复渲染不再重新解码）
     if mask_path and os.path.exists(mask_path):
-        mask = np.array(Image.open(mask_path))
-        wc_kwargs['mask'] = mask
+        wc_kwargs['mask'] = load_mask(mask_path)
     
     # 创建词云对象
-    wordcloud = WordCloud(**wc_kwargs).generate(words_str)
+    wordcloud = WordCloud(**wc_kwargs)
+    if layout == 'fast':
+        import fast_layout
+        return fast_layout.layout(wordcloud, frequencies)
+    return wordcloud.generate_from_frequencies(frequencies)
+
+def word_cloud_to_bytes(wordcloud, image_format='png'):
+    """
+    把词云编码为图片字节
     
-    # 显示词云
-    plt.figure(figsize=(10, 8))
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis("off")
-    plt.tight_layout(pad=0)
+    参数:
+    wordcloud: 已完成布局的WordCloud对象
+    image_format: 'png' 或 'svg'
     
-    # 保存词云图片
-    wordcloud.to_file(output_path)
+    返回:
+    bytes: 图片内容
+    """
+    if image_format == 'svg':
+        return wordcloud.to_svg(embed_font=False).encode('utf-8')
+    
+    import io
+    
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format=image_format.upper())
+    return buffer.getvalue()
+
+def render_word_cloud(frequencies, output=None, mask_path=None, vocabulary=None, image_format='png', preset=None, **options):
+    """
+    无界面渲染词云：不经过matplotlib，直接把图片写入文件或缓冲区
+    
+    参数:
+    frequencies: 词到频次的映射，或与vocabulary对应的NumPy计数数组
+    output: 输出文件路径或可写的二进制文件对象；为None时返回图片字节
+    mask_path: 词云形状模板路径
+    vocabulary: frequencies为数组时对应的词表
+    image_format: 'png'、'svg' 等PIL支持的格式
+    preset: RENDER_PRESETS中的预设名称，如 'thumbnail'
+    options: 覆盖默认WordCloud参数（优先于预设）
+    
+    返回:
+    bytes: output为None时返回图片内容，否则返回None
+    """
+    if preset:
+        options = dict(RENDER_PRESETS[preset], **options)
+    wordcloud = build_word_cloud(frequencies, mask_path, vocabulary, **options)
+    
+    if output is None:
+        return word_cloud_to_bytes(wordcloud, image_format)
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            f.write(word_cloud_to_bytes(wordcloud, image_format))
+    else:
+        output.write(word_cloud_to_bytes(wordcloud, image_format))
+    return None
+
+def generate_word_cloud_from_frequencies(frequencies, output_path='wordcloud.png', mask_path=None, vocabulary=None, preset=None, metrics=None, layout=None):
+    """
+    根据已统计好的词频生成词云，不再拼接和重新切分文本
+    
+    参数:
+    frequencies: 词到频次的映射（如Counter），或与vocabulary对应的NumPy计数数组
+    output_path: 输出图片路径
+    mask_path: 词云形状模板路径
+    vocabulary: frequencies为数组时对应的词表
+    preset: RENDER_PRESETS中的预设名称，如 'thumbnail'
+    metrics: PipelineMetrics 实例，提供时分别记录布局和编码阶段
+    layout: 布局引擎，'fast' 使用 fast_layout
+    """
+    options = RENDER_PRESETS[preset] if preset else {}
+    with measure(metrics, 'layout') as record:
+        wordcloud = build_word_cloud(frequencies, mask_path, vocabulary, layout, **options)
+        record.add(items=len(wordcloud.layout_))
+    
+    # 保存词云图片（直接由PIL编码，不创建matplotlib图形）
+    with measure(metrics, 'encode') as record:
+        wordcloud.to_file(output_path)
+        record.add(items=1, n_bytes=os.path.getsize(output_path))
     print(f"词云已保存到: {output_path}")
     
     return wordcloud
 
+def generate_word_cloud(text, output_path='wordcloud.png', mask_path=None, token_cache=None, workers=1, preset=None, metrics=None, layout=None):
+    """
+    生成词云
+    
+    参数:
+    text: 要分析的文本
+    output_path: 输出图片路径
+    mask_path: 词云形状模板路径
+    token_cache: TokenCache 实例，提供时复用已缓存的分词结果
+    workers: 分词进程数，1为串行，0表示使用全部CPU核心；并行结果与串行完全一致
+    preset: RENDER_PRESETS中的预设名称，如 'thumbnail'
+    metrics: PipelineMetrics 实例，提供时分别记录分词、布局和编码阶段
+    layout: 布局引擎，'fast' 使用 fast_layout
+    """
+    # 清理文本，按行分块分词并统计词频
+    with measure(metrics, 'segment') as record:
+        lines = clean_text(text).splitlines()
+        line_counts = count_line_tokens(lines, token_cache, workers)
+        frequencies = count_tokens((), counter=line_counts)
+        record.add(items=len(lines), n_bytes=len(text.encode('utf-8')))
+    return generate_word_cloud_from_frequencies(frequencies, output_path, mask_path, preset=preset, metrics=metrics,
+                                                layout=layout)
+
 def read_text_from_file(file_path):
     """从文件读取文本"""
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
 def main():
+    parser = argparse.ArgumentParser(description="词云生成工具")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="并行分词的进程数，0表示使用全部CPU核心（默认1）")
+    parser.add_argument('--preset', choices=sorted(RENDER_PRESETS),
+                        help="渲染预设，如 thumbnail 生成低分辨率缩略图")
+    parser.add_argument('--layout', choices=LAYOUT_ENGINES, default='wordcloud',
+                        help="布局引擎，fast 在词多、画布大时快得多（默认wordcloud）")
+    args = parser.parse_args()
+    
     print("=== Word Cloud Generator ===")
     print("使用Trae AI创建的词云生成工具")
     print()
     
     # 从示例文本文件读取
     try:
+        # 预先从缓存加载jieba词典，避免首次分词时临时构建
+        load_jieba()
         text = read_text_from_file('sample_text.txt')
         print("成功读取示例文本文件！")
-        # 生成词云
-        generate_word_cloud(text, 'sample_wordcloud.png')
+        # 生成词云，分词结果缓存在.cache目录中，再次生成时无需重新分词
+        with TokenCache() as token_cache:
+            generate_word_cloud(text, 'sample_wordcloud.png', token_cache=token_cache, workers=args.workers,
+                                preset=args.preset, layout=args.layout)
         print("\n示例词云已生成！")
         print("\n后续步骤：")
         print("1. 安装依赖：pip install -r requirements.txt")